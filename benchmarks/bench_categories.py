@@ -0,0 +1,54 @@
+import argparse
+import sys
+import timeit
+from os.path import abspath, dirname
+
+# Categorical filtering: substring matching on the string columns (as
+# select_entries() used to do on every update) versus comparing the integer
+# codes computed at load time (datastore.Dataset.categories).
+#
+#   python benchmarks/bench_categories.py --rows 1000000
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+import numpy as np
+import pandas
+
+import datastore
+import synthetic
+
+# (column, widget value, substring previously matched)
+filters = [
+    ('DB', 'MarDB', 'MarDB'),
+    ('analysis_project_type', 'Metagenome assembled genome (MAG)', 'MAG'),
+    ('quality', 'Low Quality Draft', 'Low Quality Draft'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    dataset = datastore.Dataset(synthetic.input_frame(args.rows))
+    for column, value, substring in filters:
+        strings = pandas.Series(dataset.column(column))
+        codes, values = dataset.category(column)
+
+        def substring_mask():
+            return (strings.str.contains(substring) == True).values
+
+        def code_mask():
+            return codes == values.index(value)
+
+        substring_time = min(timeit.repeat(substring_mask, number=1, repeat=args.repeat))
+        code_time = min(timeit.repeat(code_mask, number=1, repeat=args.repeat))
+        extra = np.count_nonzero(substring_mask() & ~code_mask())
+        print("%-22s %-36s str.contains %8.2fms  codes %7.3fms (%5.0fx)  rows matched only by substring: %d" % (
+            column, value, 1000 * substring_time, 1000 * code_time, substring_time / code_time, extra))
+
+
+if __name__ == '__main__':
+    main()
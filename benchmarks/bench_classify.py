@@ -0,0 +1,148 @@
+import argparse
+import sys
+import time
+from os.path import abspath, dirname
+
+# Parity and timing of the ETL classification (quality, color, alpha, label):
+# the per-row loops previously in update_and_deploy_input_data.py against the
+# rule tables in classify.py. Exits non-zero if the outputs differ, in values,
+# dtypes or the text written to input.tsv.
+#
+#   python benchmarks/bench_classify.py --rows 1000000
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+import numpy as np
+import pandas
+
+import classify
+import synthetic
+
+
+def legacy(complete_df):
+    # Verbatim copy of the loops replaced by classify.classify()
+    quality = []
+    for index, row in complete_df.iterrows():
+        if row['DB'] == 'MarRef':
+            quality.append('Finished')
+        elif row['Completeness'] == 'missing' or row['Contamination'] == 'missing':
+            quality.append('NA')
+        elif float(row['Completeness']) > 90 and float(row['Contamination']) < 5 and float(row['rRNA5S']) > 1 and float(row['rRNA16S']) > 1 and float(row['rRNA23S']) > 1 and float(row['Unique_tRNAs']) > 17:
+            quality.append('High Quality Draft')
+        elif float(row['Completeness']) > 90 and float(row['Contamination']) < 5:
+            quality.append('Near Complete')
+        elif float(row['Completeness']) >= 50 and float(row['Contamination']) < 10:
+            quality.append('Medium Quality Draft')
+        elif float(row['Completeness']) < 50 and float(row['Contamination']) < 10:
+            quality.append('Low Quality Draft')
+        elif float(row['Contamination']) > 10:
+            quality.append('Very Low Quality Draft')
+        else:
+            quality.append('NA')
+    complete_df['quality'] = quality
+
+    colorarray = []
+    for DB, apt in zip(complete_df['DB'], complete_df['analysis_project_type']):
+        if DB == "MarRef" and apt == "missing":
+            colorarray.append("grey")
+        elif DB == "MarDB" and apt == "missing":
+            colorarray.append("grey")
+        elif DB == "MarRef":
+            colorarray.append("blue")
+        elif DB == "MarDB":
+            colorarray.append("green")
+        else:
+            colorarray.append("grey")
+    complete_df['color'] = colorarray
+
+    alpha = []
+    for analysis_type in complete_df['analysis_project_type']:
+        if analysis_type == "Whole genome sequencing (WGS)":
+            alpha.append(1)
+        elif analysis_type == "Metagenome assembled genome (MAG)":
+            alpha.append(0.6)
+        elif analysis_type == "Single amplified genome (SAG)":
+            alpha.append(0.4)
+        else:
+            alpha.append(1)
+    complete_df['alpha'] = alpha
+
+    label = []
+    for DB, apt in zip(complete_df['DB'], complete_df['analysis_project_type']):
+        if DB == "MarRef" and apt == "missing":
+            label.append("MarRef (Unknown type)")
+        elif DB == "MarDB" and apt == "missing":
+            label.append("MarDB (Unknown type)")
+        elif DB == "MarRef" and apt == "Whole genome sequencing (WGS)":
+            label.append("MarRef (Whole genome sequencing (WGS))")
+        elif DB == "MarDB" and apt == "Whole genome sequencing (WGS)":
+            label.append("MarDB (Whole genome sequencing (WGS))")
+        elif DB == "MarRef" and apt == "Metagenome assembled genome (MAG)":
+            label.append("MarRef (Metagenome assembled genome (MAG))")
+        elif DB == "MarDB" and apt == "Metagenome assembled genome (MAG)":
+            label.append("MarDB (Metagenome assembled genome (MAG))")
+        elif DB == "MarRef" and apt == "Single amplified genome (SAG)":
+            label.append("MarRef (Single amplified genome (SAG))")
+        elif DB == "MarDB" and apt == "Single amplified genome (SAG)":
+            label.append("MarDB (Single amplified genome (SAG))")
+        else:
+            label.append("Unknown")
+    complete_df['label'] = label
+    return complete_df
+
+
+def unclassified(rows, seed=0):
+    frame = synthetic.input_frame(rows, seed).drop(columns=[name for name, rules, default in classify.derived_columns])
+    # Exercise the edge cases: Contamination exactly on the thresholds and unknown databases
+    rng = np.random.default_rng(seed + 1)
+    frame.loc[rng.random(rows) < 0.01, 'Contamination'] = 10.0
+    frame.loc[rng.random(rows) < 0.01, 'Completeness'] = 90.0
+    frame.loc[rng.random(rows) < 0.001, 'DB'] = 'Other'
+    return frame
+
+
+def differences(result, expected):
+    # Derived columns whose values, dtype or TSV text differ between the two outputs
+    different = []
+    for name, rules, default in classify.derived_columns:
+        try:
+            pandas.testing.assert_series_equal(result[name], expected[name])
+        except AssertionError:
+            different.append(name)
+        else:
+            if result[[name]].to_csv(sep='\t') != expected[[name]].to_csv(sep='\t'):
+                different.append(name)
+    return different
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    frame = unclassified(args.rows)
+
+    start = time.perf_counter()
+    expected = legacy(frame.copy())
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = classify.classify(frame.copy())
+    vectorized_time = time.perf_counter() - start
+
+    print("rows %d: loops %.2fs, rule tables %.3fs (%.0fx)" % (args.rows, legacy_time, vectorized_time, legacy_time / vectorized_time))
+    # Also without any MAG or SAG, where every alpha is the integer 1
+    whole_genomes = frame.head(10000).copy()
+    whole_genomes.loc[whole_genomes['analysis_project_type'].isin([classify.MAG, classify.SAG]), 'analysis_project_type'] = classify.WGS
+    failed = False
+    for name, result, expected in [('all types', result, expected), ('WGS only', classify.classify(whole_genomes.copy()), legacy(whole_genomes.copy()))]:
+        different = differences(result, expected)
+        print("parity, %s: %s" % (name, "columns differ: " + ", ".join(different) if different else "ok"))
+        failed = failed or bool(different)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from os.path import abspath, basename, dirname, join
+
+# Cold start of serve.py: seconds from launching the process until it answers
+# HTTP, and until the first browser session's page (main.py run, document
+# rendered) is served. Runs on input.col plus manifest.json as written by
+# update_and_deploy_input_data.py; exits non-zero when the median first render
+# exceeds --budget. The server's warm-up session (server_lifecycle.warm_up)
+# runs before it answers the first request, so it is part of both times; the
+# search index it builds afterwards in a worker thread may still be running
+# during the first render.
+#
+#   python benchmarks/bench_coldstart.py --rows 1000000 --runs 5 --budget 3
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+import columnar
+import manifest
+import synthetic
+from check_workers import free_port, wait
+
+
+def cold_start(path):
+    port = free_port()
+    env = dict(os.environ, MMP_INPUT_PATH=path, MMP_RELOAD_INTERVAL='0')
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', join(app_path, 'serve.py'), '--port', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait('http://localhost:%d/rows?ids=' % port, process)
+        ready = time.perf_counter() - start
+        app = 'http://localhost:%d/%s' % (port, basename(app_path))
+        urllib.request.urlopen(app, timeout=60).read()
+        first = time.perf_counter() - start
+        started = time.perf_counter()
+        urllib.request.urlopen(app, timeout=60).read()
+        second = time.perf_counter() - started
+        return ready, first, second
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=3.0, help="seconds from launch to the first rendered session")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        tsv = synthetic.write_input(join(tmp, 'input.tsv'), args.rows)
+        columnar.convert(tsv)
+        manifest.write(tsv)
+        runs = [cold_start(tsv) for i in range(args.runs)]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+    ready, first, second = [median(values) for values in zip(*runs)]
+    print("%d rows, median of %d runs: serving after %.2fs, first session rendered after %.2fs (budget %.2fs), next session %.2fs" % (
+        args.rows, args.runs, ready, first, args.budget, second))
+    if first > args.budget:
+        print("first render over budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
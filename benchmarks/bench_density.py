@@ -0,0 +1,70 @@
+import argparse
+import sys
+import time
+from os.path import abspath, dirname
+
+# Render payload and server time of a selection drawn as circles (one row per
+# point in source.data) versus as a density image (density.py).
+#
+#   python benchmarks/bench_density.py --sizes 10000,100000,1000000
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource
+
+import density
+import settings
+import synthetic
+from bench_payload import message_size
+
+# Plot size in main.py
+shape = (800 // settings.density_cell_pixels, 1500 // settings.density_cell_pixels)
+
+
+def send(data):
+    # Serialized size of replacing a data source's data with `data`
+    doc = Document()
+    source = ColumnDataSource(data=dict((name, []) for name in data))
+    doc.add_root(source)
+    events = []
+    record = events.append
+    doc.on_change(record)
+    source.data = data
+    doc.remove_on_change(record)
+    return message_size(events)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    args = parser.parse_args()
+
+    print("%9s %16s %16s %16s %16s" % ("points", "circles (bytes)", "circles (ms)", "density (bytes)", "density (ms)"))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        frame = synthetic.input_frame(size)
+        x = frame['Assembly_length'].values
+        y = frame['Completeness'].values
+
+        start = time.perf_counter()
+        data = dict(
+            x=x, y=y,
+            color=frame['color'].values, db=frame['db'].values, mmpid=frame['mmp_ID'].values,
+            fsn=frame['full_scientific_name'].values, apt=frame['analysis_project_type'].values,
+            alpha=frame['alpha'].values, label=frame['label'].values, qual=frame['quality'].values,
+            comp=frame['Completeness'].values, cont=frame['Contamination'].values)
+        points_bytes = send(data)
+        points_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        codes = density.channel_codes(frame['DB'].values)
+        data = density.image_data(x, y, codes, density.extent(x, (None, None)), density.extent(y, (None, None)), shape)
+        density_bytes = send(data)
+        density_time = time.perf_counter() - start
+
+        print("%9d %16d %16.1f %16d %16.1f" % (size, points_bytes, 1000 * points_time, density_bytes, 1000 * density_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os.path import abspath, dirname, join
+
+# Runs update_and_deploy_input_data.py against a local HTTP stand-in for the
+# MarRef/MarDB metadata server: a cold run, a run where nothing changed
+# upstream (conditional requests answered with 304, input.tsv kept) and a run
+# after one database changed.
+#
+#   python benchmarks/bench_download.py --rows 100000 --latency 0.5
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+import synthetic
+
+
+class MetadataHandler(SimpleHTTPRequestHandler):
+    # Static files with an ETag, If-None-Match support and a fixed response latency
+    latency = 0
+
+    def send_head(self):
+        time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            etag = '"%s"' % hashlib.md5(('%d-%d' % (stat.st_mtime_ns, stat.st_size)).encode()).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return None
+            self.etag = etag
+        return SimpleHTTPRequestHandler.send_head(self)
+
+    def end_headers(self):
+        if getattr(self, 'etag', None):
+            self.send_header('ETag', self.etag)
+            self.etag = None
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_etl(urls, output):
+    command = [sys.executable, join(app_path, 'update_and_deploy_input_data.py'), '--output', output]
+    for db, url in urls.items():
+        command += ['--url', '%s=%s' % (db, url)]
+    start = time.perf_counter()
+    result = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - start, result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000, help="rows per database")
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds before the stand-in server answers")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    served = join(tmp, 'served')
+    os.makedirs(served)
+    for seed, db in enumerate(['MarRef', 'MarDB']):
+        synthetic.write_metadata(join(served, db + '.tsv'), args.rows, seed)
+
+    MetadataHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(MetadataHandler, directory=served))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = dict((db, 'http://127.0.0.1:%d/%s.tsv' % (server.server_port, db)) for db in ['MarRef', 'MarDB'])
+    output = join(tmp, 'inputdata', 'input.tsv')
+
+    elapsed, message = run_etl(urls, output)
+    print("cold run:          %6.2fs" % elapsed)
+    elapsed, message = run_etl(urls, output)
+    print("unchanged run:     %6.2fs  %s" % (elapsed, message))
+    time.sleep(0.01)
+    synthetic.write_metadata(join(served, 'MarDB.tsv'), args.rows + 1, 1)
+    elapsed, message = run_etl(urls, output)
+    print("one changed file:  %6.2fs" % elapsed)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
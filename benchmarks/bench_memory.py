@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join
+
+# Resident memory of a server process holding the dataset, loaded from
+# input.tsv (pandas) or from the compact input.col (columnar.py, memory-mapped).
+# Every measurement runs in a fresh process; RssAnon is private memory,
+# RssFile the mapped file pages (shared with other processes and evictable).
+#
+#   python benchmarks/bench_memory.py --rows 100000,1000000 --sessions 1
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+
+def memory():
+    # {'VmRSS': kB, 'RssAnon': kB, 'RssFile': kB} of this process (Linux)
+    values = {}
+    with open('/proc/self/status') as handle:
+        for line in handle:
+            name, value = line.split(':', 1)
+            if name in ('VmRSS', 'RssAnon', 'RssFile'):
+                values[name] = int(value.split()[0])
+    return values
+
+
+def child(path, sessions):
+    os.environ['MMP_INPUT_PATH'] = path
+    import datastore
+    import filterindex
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+    before = memory()
+    start = time.perf_counter()
+    dataset = datastore.load(path)
+    # Touch the columns every session uses, like the first update() does
+    filterindex.Selection(dataset.index).select(filterindex.FilterState(
+        'All', 'All', 'All', dataset.bounds['QS'], dataset.bounds['contigs'], dataset.bounds['Assembly_length']))
+    loaded = time.perf_counter() - start
+    after_load = memory()
+    application = Application(DirectoryHandler(filename=app_path))
+    documents = [application.create_document() for i in range(sessions)]
+    after_sessions = memory()
+    print(json.dumps({
+        'load_seconds': loaded,
+        'load': dict((name, after_load[name] - before[name]) for name in before),
+        'sessions': dict((name, after_sessions[name] - after_load[name]) for name in before),
+    }))
+
+
+def measure(path, sessions):
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', abspath(__file__), '--child', path, '--sessions', str(sessions)], stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='100000,1000000')
+    parser.add_argument('--sessions', type=int, default=1, help="sessions opened after loading")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.sessions)
+        return
+
+    import pandas
+
+    import columnar
+    import synthetic
+
+    results = []
+    tmp = tempfile.mkdtemp()
+    try:
+        for rows in [int(value) for value in args.rows.split(',')]:
+            tsv = synthetic.write_input(join(tmp, 'input.tsv'), rows)
+            compact_dir = join(tmp, 'compact')
+            os.makedirs(compact_dir)
+            compact = columnar.write(pandas.read_csv(tsv, sep='\t'), join(compact_dir, 'input.col'))
+            for name, path in [('tsv', tsv), ('compact', compact)]:
+                result = measure(path, args.sessions)
+                result.update(rows=rows, format=name, file_bytes=os.path.getsize(path))
+                results.append(result)
+                print("%9d rows  %-8s file %7.1f MB  load %6.2fs  RSS +%7.1f MB (anon %7.1f, file %7.1f)  per session +%6.1f MB" % (
+                    rows, name, result['file_bytes'] / 1e6, result['load_seconds'], result['load']['VmRSS'] / 1024.,
+                    result['load']['RssAnon'] / 1024., result['load']['RssFile'] / 1024., result['sessions']['VmRSS'] / 1024. / max(1, args.sessions)))
+            os.remove(tsv)
+            shutil.rmtree(compact_dir)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import tempfile
+from os.path import abspath, dirname, join
+
+# Bytes sent to the browser per interaction (PATCH-DOC messages) for each
+# settings.filter_mode, on a synthetic dataset.
+#
+#   python benchmarks/bench_payload.py --rows 30000
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+# Widget changes replayed against a fresh session, in order
+interactions = [
+    ('minqsscore', 10),
+    ('minqsscore', 15),
+    ('maxcontigs', 500),
+    ('database', 'MarDB'),
+    ('analysis_type', 'Metagenome assembled genome (MAG)'),
+    ('y_axis', 'GC Content'),
+]
+
+# Widget titles, to find them in the session document
+titles = {
+    'minqsscore': 'Minimum QS score',
+    'maxcontigs': 'Maximum Number of Contigs',
+    'database': 'Database',
+    'analysis_type': 'Type',
+    'y_axis': 'Y Axis',
+}
+
+
+def message_size(events):
+    from bokeh.protocol import Protocol
+    message = Protocol().create("PATCH-DOC", events)
+    size = len(message.header_json) + len(message.metadata_json) + len(message.content_json)
+    for header, payload in message.buffers:
+        size += len(payload)
+    return size
+
+
+def flush(doc):
+    # Run the update() calls queued by the UpdateScheduler, there is no event loop here
+    for callback in list(doc.session_callbacks):
+        callback.callback()
+
+
+def measure(application, mode):
+    from bokeh.document.events import DocumentPatchedEvent
+    from bokeh.models.widgets import InputWidget, Slider
+    import settings
+
+    settings.filter_mode = mode
+    doc = application.create_document()
+    print("%s mode: initial document %d bytes" % (mode, len(doc.to_json_string())))
+    widgets = dict((model.title, model) for model in doc.select({'type': (InputWidget, Slider)}))
+    for name, value in interactions:
+        target = widgets[titles[name]]
+        events = []
+        record = events.append
+        doc.on_change(record)
+        target.value = value
+        flush(doc)
+        doc.remove_on_change(record)
+        # The widget change itself comes from the browser, only count what is sent back
+        events = [event for event in events if isinstance(event, DocumentPatchedEvent) and getattr(event, 'model', None) is not target]
+        print("  %-15s %-36s %9d bytes" % (name, value, message_size(events) if events else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=30000)
+    parser.add_argument('--modes', default='data,view')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['MMP_INPUT_PATH'] = join(tmp, 'input.tsv')
+
+    import synthetic
+    synthetic.write_input(os.environ['MMP_INPUT_PATH'], args.rows)
+
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+
+    application = Application(DirectoryHandler(filename=app_path))
+    for mode in args.modes.split(','):
+        measure(application, mode)
+
+
+if __name__ == '__main__':
+    main()
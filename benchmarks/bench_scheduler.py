@@ -0,0 +1,94 @@
+import argparse
+import sys
+import time
+from os.path import abspath, dirname
+
+# Fires rapid slider changes at an UpdateScheduler running on a tornado event
+# loop and counts how many update() recomputes actually run. Exits non-zero
+# when the final state is dropped, when there are more runs than one per
+# interval of the drag plus the first and the last, or when a burst of
+# back-to-back changes is not merged into exactly one run.
+#
+#   python benchmarks/bench_scheduler.py --events 100 --spacing 5 --cost 20
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from tornado.ioloop import IOLoop
+
+from scheduler import UpdateScheduler
+
+
+class LoopDocument(object):
+    # The two Document methods UpdateScheduler uses, backed by a plain IOLoop
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def add_next_tick_callback(self, callback):
+        self.loop.add_callback(callback)
+
+    def add_timeout_callback(self, callback, timeout_milliseconds):
+        self.loop.call_later(timeout_milliseconds / 1000.0, callback)
+
+
+def drag(events, spacing, cost, interval):
+    loop = IOLoop()
+    values = []
+
+    def update():
+        # Stand-in for main.update(): reads the current slider value and takes `cost` ms
+        values.append(slider['value'])
+        time.sleep(cost / 1000.0)
+
+    slider = dict(value=0)
+    # When each change actually fired: later than planned while update() blocks the loop
+    fired = []
+    scheduler = UpdateScheduler(LoopDocument(loop), update, interval=interval)
+
+    def change(i):
+        slider['value'] = i
+        fired.append(time.perf_counter())
+        scheduler.request('value', i - 1, i)
+
+    def burst():
+        # Every change back to back, within one callback
+        for i in range(1, events + 1):
+            change(i)
+
+    if spacing > 0:
+        for i in range(1, events + 1):
+            loop.call_later(i * spacing / 1000.0, change, i)
+    else:
+        loop.add_callback(burst)
+    loop.call_later((events * spacing + interval + cost) / 1000.0 + 0.2, loop.stop)
+    loop.start()
+    loop.close()
+    return scheduler, values, fired[-1] - fired[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--spacing', type=float, default=5, help="milliseconds between slider events")
+    parser.add_argument('--cost', type=float, default=20, help="milliseconds per update()")
+    parser.add_argument('--interval', type=int, default=100, help="settings.update_interval")
+    args = parser.parse_args()
+
+    scheduler, values, duration = drag(args.events, args.spacing, args.cost, args.interval)
+    print("%d slider changes, %d recomputes (unscheduled: %d), final value %d, last value seen %d" % (
+        scheduler.requests, scheduler.runs, args.events, args.events, values[-1]))
+    if values[-1] != args.events:
+        sys.exit("the final slider state was dropped")
+    # One run when the drag starts, at most one per interval while it lasts
+    # (about events * spacing) and the last one at most an interval after it
+    limit = int(1000 * duration / args.interval) + 2
+    if scheduler.runs > limit:
+        sys.exit("%d recomputes, expected at most %d" % (scheduler.runs, limit))
+    burst, values, duration = drag(args.events, 0, args.cost, args.interval)
+    print("%d back-to-back changes, %d recomputes, last value seen %d" % (burst.requests, burst.runs, values[-1]))
+    if burst.runs != 1 or values[-1] != args.events:
+        sys.exit("back-to-back changes were not merged into one recompute of the final state")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join
+
+# The two settings.backend options side by side: 'memory' (input.col loaded by
+# datastore.py, rows selected with the filter index) and 'sqlite' (queries on
+# input.sqlite, sqlstore.py). Per filter state it times what an update in
+# 'data' filter mode does with the rows: select them with the plotted columns,
+# compute the statistics and read the tooltip columns of the rows drawn as
+# points (none above settings.density_threshold, where a density image is
+# drawn instead). Every backend runs in a fresh process, whose resident memory
+# is reported after opening the data and after the queries (RssAnon private,
+# RssFile mapped file pages).
+#
+#   python benchmarks/bench_sqlite.py --rows 100000,1000000
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from bench_memory import memory
+
+# Filter states: (name, changes to the default state)
+states = [
+    ('default', {}),
+    ('qs', {'qs': (50, 100)}),
+    ('contigs', {'contigs': (1, 100)}),
+    ('database', {'database': 'MarRef'}),
+    ('combined', {'qs': (50, 100), 'contigs': (1, 500), 'database': 'MarDB', 'analysis_type': 'Metagenome assembled genome (MAG)'}),
+    ('narrow', {'qs': (90, 92), 'length': (4e6, 5e6)}),
+    ('search', {'search': 'strain 12'}),
+]
+axes = ('Assembly_length', 'Completeness')
+
+
+def child(path, backend, repeat):
+    import datastore
+    import filterindex
+    import settings
+    import sqlstore
+    import summary
+
+    names = sorted(set(['color', 'db', 'mmp_ID', 'full_scientific_name', 'analysis_project_type', 'alpha', 'label', 'quality', 'Completeness', 'Contamination']) | set(axes))
+    before = memory()
+    start = time.perf_counter()
+    if backend == 'sqlite':
+        store = sqlstore.Store(sqlstore.path_for(path))
+        bounds = store.bounds
+    else:
+        dataset = datastore.read(path)
+        bounds = dataset.bounds
+    opened = time.perf_counter() - start
+    after_open = memory()
+
+    def update(state):
+        if backend == 'sqlite':
+            selected = store.select(state, list(axes) + ['DB'])
+            statistics = summary.summarize_values(
+                selected.column(axes[0]), selected.column(axes[1]), selected.column('DB'), store.databases, store.edges(axes[0]), store.edges(axes[1]))
+            if statistics.shown <= settings.density_threshold:
+                store.take(selected.rows, names)
+            return len(selected), statistics
+        rows = filterindex.Selection(dataset.index).select(state)
+        statistics = summary.summarize(dataset, rows, axes[0], axes[1])
+        if statistics.shown <= settings.density_threshold:
+            dataset.take(rows, names)
+        return len(rows), statistics
+
+    default = filterindex.FilterState('All', 'All', 'All', bounds['QS'], bounds['contigs'], bounds['Assembly_length'])
+    results = []
+    for name, changes in states:
+        state = default._replace(**changes)
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            rows, statistics = update(state)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append(dict(state=name, seconds=best, rows=rows, shown=statistics.shown))
+    after = memory()
+    print(json.dumps({
+        'open_seconds': opened,
+        'open': dict((key, after_open[key] - before[key]) for key in before),
+        'queries': dict((key, after[key] - before[key]) for key in before),
+        'states': results,
+    }))
+
+
+def measure(path, backend, repeat):
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', abspath(__file__), '--child', path, '--backend', backend, '--repeat', str(repeat)], stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='100000,1000000')
+    parser.add_argument('--repeat', type=int, default=3, help="runs per state, the best is reported")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--backend', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.backend, args.repeat)
+        return
+
+    import columnar
+    import sqlstore
+    import synthetic
+
+    results = []
+    tmp = tempfile.mkdtemp()
+    try:
+        for rows in [int(value) for value in args.rows.split(',')]:
+            tsv = synthetic.write_input(join(tmp, 'input.tsv'), rows)
+            converted = {}
+            for backend, convert in [('memory', columnar.convert), ('sqlite', sqlstore.convert)]:
+                start = time.perf_counter()
+                written = convert(tsv)
+                converted[backend] = (time.perf_counter() - start, os.path.getsize(written))
+            print("%9d rows" % rows)
+            measured = {}
+            for backend in ('memory', 'sqlite'):
+                result = measure(tsv, backend, args.repeat)
+                result.update(rows=rows, backend=backend, convert_seconds=converted[backend][0], file_bytes=converted[backend][1])
+                results.append(result)
+                measured[backend] = result
+                print("  %-7s file %7.1f MB written in %6.2fs  open %6.3fs  RSS +%7.1f MB (anon %7.1f, file %7.1f), after queries +%7.1f MB (anon %7.1f)" % (
+                    backend, result['file_bytes'] / 1e6, result['convert_seconds'], result['open_seconds'], result['open']['VmRSS'] / 1024.,
+                    result['open']['RssAnon'] / 1024., result['open']['RssFile'] / 1024., result['queries']['VmRSS'] / 1024., result['queries']['RssAnon'] / 1024.))
+            for memory_state, sqlite_state in zip(measured['memory']['states'], measured['sqlite']['states']):
+                if memory_state['rows'] != sqlite_state['rows'] or memory_state['shown'] != sqlite_state['shown']:
+                    print("  %s: backends disagree (%d vs %d rows)" % (memory_state['state'], memory_state['rows'], sqlite_state['rows']))
+                    sys.exit(1)
+                print("  %-9s %8d rows  memory %8.1f ms  sqlite %8.1f ms  (x%.1f)" % (
+                    memory_state['state'], memory_state['rows'], memory_state['seconds'] * 1e3, sqlite_state['seconds'] * 1e3,
+                    sqlite_state['seconds'] / max(memory_state['seconds'], 1e-9)))
+            for path in (tsv, columnar.path_for(tsv), sqlstore.path_for(tsv)):
+                os.remove(path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, basename, dirname, join
+
+# Session-startup latency: every new browser session runs main.py once.
+# In process, documents are created one after the other, parsing input.tsv per
+# session (old behaviour) and with the shared, process-wide dataset loaded by
+# server_lifecycle.on_server_loaded. Then a real serve.py gets --sessions page
+# requests at once, each opening a session, as when that many users arrive
+# together: per request latency (including the wait for the sessions before it
+# on the server's event loop) and the time until all are served.
+#
+#   python benchmarks/bench_startup.py --rows 30000 --sessions 50
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+
+def create_documents(application, sessions, before_each=None):
+    # Sequential document creation in this process, seconds per document
+    timings = []
+    for i in range(sessions):
+        start = time.perf_counter()
+        if before_each:
+            before_each()
+        application.create_document()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def concurrent_sessions(path, sessions):
+    # (seconds per page request, seconds until all were answered) of `sessions`
+    # concurrent requests to a serve.py on path
+    from check_workers import free_port, wait
+
+    port = free_port()
+    env = dict(os.environ, MMP_INPUT_PATH=path, MMP_RELOAD_INTERVAL='0')
+    process = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', join(app_path, 'serve.py'), '--port', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait('http://localhost:%d/metrics' % port, process)
+        app = 'http://localhost:%d/%s' % (port, basename(app_path))
+
+        def request(i):
+            start = time.perf_counter()
+            urllib.request.urlopen(app, timeout=300).read()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            timings = list(pool.map(request, range(sessions)))
+        return timings, time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summary(name, timings, total=None):
+    # total: wall time of the run, the sum of the timings by default
+    timings = sorted(timings)
+    print("%-22s total %7.2fs  mean %7.1fms  p95 %7.1fms" % (
+        name, sum(timings) if total is None else total, 1000 * sum(timings) / len(timings), 1000 * timings[int(len(timings) * 0.95) - 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=30000)
+    parser.add_argument('--sessions', type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['MMP_INPUT_PATH'] = join(tmp, 'input.tsv')
+
+    import synthetic
+    synthetic.write_input(os.environ['MMP_INPUT_PATH'], args.rows)
+
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+    import datastore
+
+    application = Application(DirectoryHandler(filename=app_path))
+
+    summary("per-session parse", create_documents(application, args.sessions, before_each=datastore.reset))
+
+    datastore.load()
+    summary("shared dataset", create_documents(application, args.sessions))
+
+    summary("concurrent (serve.py)", *concurrent_sessions(os.environ['MMP_INPUT_PATH'], args.sessions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from os.path import abspath, dirname, join
+
+# Parity of the browser filter (clientfilter.py, MMP_FILTER_MODE=client) with
+# the server filter (filterindex.Selection) on random widget states. Runs the
+# generated CustomJSFilter code in node; exits non-zero on any difference.
+#
+# Also types search queries into a shared search.SearchIndex and compares its
+# masks with a plain substring match.
+#
+#   python benchmarks/check_client_filter.py --rows 100000 --states 200
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(abspath(__file__)))
+
+import numpy as np
+
+import clientfilter
+import datastore
+import filterindex
+import search
+import synthetic
+
+# Stand-ins for the Bokeh objects the filter code uses
+harness = """
+const fs = require('fs');
+const input = JSON.parse(fs.readFileSync(process.argv[2]));
+const data = {};
+for (const [name, values] of Object.entries(input.columns))
+    data[name] = name == 'f_search' ? values : name.startsWith('f_') && input.bits.includes(name) ? Uint8Array.from(values) : Float64Array.from(values.map(v => v === null ? NaN : v));
+const source = {data: data, get_length: () => input.rows};
+const names = Object.keys(input.states[0]);
+const filter = new Function('source', 'title', ...names, input.code);
+const results = input.states.map(state => {
+    const widgets = names.map(name => ({value: state[name], value_input: state[name]}));
+    return filter(source, {text: ''}, ...widgets);
+});
+fs.writeFileSync(process.argv[3], JSON.stringify(results));
+"""
+
+
+def random_state(rng, dataset):
+    def bounds(name, low, high):
+        values = sorted([rng.uniform(low, high), rng.uniform(low, high)])
+        return values if rng.random() < 0.8 else list(dataset.bounds[name])
+    state = dict(
+        database=rng.choice(['All'] + list(dict(filterindex.category_filters)['database'][1])),
+        analysis_type=rng.choice(['All'] + list(dict(filterindex.category_filters)['analysis_type'][1])),
+        draft=rng.choice(['All'] + list(dict(filterindex.category_filters)['draft'][1])),
+    )
+    state['qs_min'], state['qs_max'] = bounds('QS', -150, 100)
+    state['contigs_min'], state['contigs_max'] = bounds('contigs', 1, 3000)
+    state['length_min'], state['length_max'] = bounds('Assembly_length', 1, 1.2e7)
+    # Mostly no search; otherwise a piece of a name or ID, with the case and padding of a user
+    state['search'] = ''
+    if rng.random() < 0.4:
+        column = rng.choice(search.search_columns)
+        value = str(dataset.column(column)[rng.randrange(len(dataset))])
+        start = rng.randrange(len(value))
+        state['search'] = rng.choice([str.upper, str.lower, str])(' ' + value[start:start + rng.randint(1, 12)])
+    return state
+
+
+def expected_search(texts, query):
+    # Rows search.SearchIndex must match, from the "<name>\n<ID>" texts of clientfilter.search_texts()
+    query = search.normalize(query)
+    if len(query) < search.gram:
+        return np.array([text.startswith(query) or ('\n' + query) in text for text in texts])
+    return np.array([query in text for text in texts])
+
+
+def check_typing(rng, dataset, queries):
+    # Queries as typed into one shared index: a character at a time, several at
+    # once (merged keystrokes, pastes) and with backspaces, so that searches
+    # extend the occurrences kept from earlier ones (TextIndex.refine). Returns
+    # the number of differences
+    differences = 0
+    # An occurrence of the previous query ends the last value (no bytes after it)
+    index = search.TextIndex(np.arange(51), ['abcdab%d' % i for i in range(50)] + ['xabcd'])
+    for query in ['abcd', 'abcdab', 'abcdabcd', 'abcd']:
+        mask = index.mask(query)
+        expected = np.array([query in value for value in index.values])
+        if not np.array_equal(mask, expected):
+            differences += 1
+            print("search differs: %r on the end of the data" % query)
+    index = search.SearchIndex(dataset)
+    texts = clientfilter.search_texts(dataset)
+    for query in queries:
+        typed = ''
+        while len(typed) < len(query):
+            typed = query[:len(typed) + rng.choice([1, 1, 1, 2, 5])]
+            if rng.random() < 0.1:
+                typed = typed[:-1]
+            if not np.array_equal(index.mask(typed), expected_search(texts, typed)):
+                differences += 1
+                print("search differs: %r" % typed)
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--states', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    synthetic.write_input(join(tmp, 'input.tsv'), args.rows)
+    dataset = datastore.read(join(tmp, 'input.tsv'))
+
+    rng = random.Random(0)
+    states = [random_state(rng, dataset) for i in range(args.states)]
+    columns = clientfilter.filter_columns(dataset)
+    columns['x'] = dataset.column('Assembly_length')
+    columns['y'] = dataset.column('Completeness')
+    with open(join(tmp, 'input.json'), 'w') as handle:
+        json.dump(dict(
+            rows=len(dataset),
+            code=clientfilter.filter_code(),
+            bits=['f_' + field for field, category in filterindex.category_filters],
+            columns=dict((name, [None if np.isnan(v) else v for v in values.tolist()] if values.dtype.kind == 'f' else values.tolist()) for name, values in columns.items()),
+            states=states), handle)
+    with open(join(tmp, 'harness.js'), 'w') as handle:
+        handle.write(harness)
+    subprocess.check_call(['node', join(tmp, 'harness.js'), join(tmp, 'input.json'), join(tmp, 'output.json')])
+    with open(join(tmp, 'output.json')) as handle:
+        results = json.load(handle)
+
+    selection = filterindex.Selection(dataset.index)
+    differences = 0
+    for state, indices in zip(states, results):
+        rows = selection.select(filterindex.FilterState(
+            database=state['database'],
+            analysis_type=state['analysis_type'],
+            draft=state['draft'],
+            qs=(state['qs_min'], state['qs_max']),
+            contigs=(state['contigs_min'], state['contigs_max']),
+            length=(state['length_min'], state['length_max']),
+            search=state['search']))
+        if not np.array_equal(rows, indices):
+            differences += 1
+            print("differs: %s (server %d rows, client %d rows)" % (state, len(rows), len(indices)))
+    queries = [state['search'] for state in states if state['search']] + ['synthetic bacterium strain 1', 'mmp0000', 'strain 12']
+    differences += check_typing(rng, dataset, queries)
+    print("%d states, %d searches typed, %d differences" % (len(states), len(queries), differences))
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from os.path import abspath, basename, dirname, join
+
+# Memory of serve.py --num-procs N on a compact input.col. Starts the server
+# with 1 and with N workers, opens a few sessions and reads every worker's
+# /proc/<pid>/smaps: the input.col mapping (columns and filter indexes) must be
+# shared, i.e. its proportional set size (Pss) summed over the workers stays
+# within one copy of the file, and the private memory of a worker must not grow
+# with the number of workers. Exits non-zero otherwise.
+#
+#   python benchmarks/check_workers.py --rows 1000000 --workers 4
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+import pandas
+
+import columnar
+import synthetic
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open('/proc/%s/stat' % name) as handle:
+                    # pid (comm) state ppid ...
+                    if int(handle.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(name))
+            except (IOError, IndexError, ValueError):
+                pass
+    return sorted(pids)
+
+
+def memory(pid, path):
+    # kB: RssAnon of the process, Rss and Pss of its mappings of `path`
+    values = {'RssAnon': 0, 'Rss': 0, 'Pss': 0}
+    with open('/proc/%d/status' % pid) as handle:
+        for line in handle:
+            if line.startswith('RssAnon:'):
+                values['RssAnon'] = int(line.split()[1])
+    mapped = False
+    with open('/proc/%d/smaps' % pid) as handle:
+        for line in handle:
+            fields = line.split()
+            if '-' in fields[0] and ':' not in fields[0]:
+                # Mapping header: address perms offset dev inode [path]
+                mapped = len(fields) > 5 and fields[5] == path
+            elif mapped and fields[0] in ('Rss:', 'Pss:'):
+                values[fields[0][:-1]] += int(fields[1])
+    return values
+
+
+def wait(url, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited with %d" % process.returncode)
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("%s not answering after %ds" % (url, timeout))
+
+
+def run(path, workers, sessions):
+    port = free_port()
+    env = dict(os.environ, MMP_INPUT_PATH=path, MMP_RELOAD_INTERVAL='0')
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', join(app_path, 'serve.py'), '--port', str(port), '--num-procs', str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        app = 'http://localhost:%d/%s' % (port, basename(app_path))
+        wait('http://localhost:%d/metrics' % port, process)
+        started = time.perf_counter() - start
+        pids = children(process.pid) if workers > 1 else [process.pid]
+        mapped = columnar.path_for(path)
+        idle = dict((pid, memory(pid, mapped)) for pid in pids)
+        for i in range(sessions * workers):
+            urllib.request.urlopen(app, timeout=60).read()
+        busy = dict((pid, memory(pid, mapped)) for pid in pids)
+        return started, idle, busy
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sessions', type=int, default=3, help="sessions opened per worker")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        tsv = synthetic.write_input(join(tmp, 'input.tsv'), args.rows)
+        compact = columnar.write(pandas.read_csv(tsv, sep='\t'), columnar.path_for(tsv))
+        file_kb = os.path.getsize(compact) / 1024.
+
+        failures = []
+        baseline = None
+        for workers in sorted(set([1, args.workers])):
+            started, idle, busy = run(tsv, workers, args.sessions)
+            if len(idle) != workers:
+                failures.append("%d workers started, %d found" % (workers, len(idle)))
+            anon = max(values['RssAnon'] for values in idle.values())
+            pss = sum(values['Pss'] for values in busy.values())
+            rss = sum(values['Rss'] for values in busy.values())
+            print("%d workers  up in %5.2fs  private per worker %7.1f MB idle, %7.1f MB with sessions  input.col resident %7.1f MB summed, %7.1f MB Pss (file %.1f MB)" % (
+                workers, started, anon / 1024., max(values['RssAnon'] for values in busy.values()) / 1024., rss / 1024., pss / 1024., file_kb / 1024.))
+            if pss > file_kb * 1.01 + 64:
+                failures.append("%d workers: input.col Pss %.1f MB exceeds the file" % (workers, pss / 1024.))
+            if baseline is None:
+                baseline = anon
+            elif anon > baseline * 1.2 + 10 * 1024:
+                failures.append("%d workers: %.1f MB private per worker, %.1f MB with one" % (workers, anon / 1024., baseline / 1024.))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
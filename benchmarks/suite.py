@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join
+
+# Benchmark suite: every ETL stage, dataset load, the filter index and the
+# session update path of each settings.filter_mode, on seeded synthetic data
+# (offline), for a range of dataset sizes. Results are written as JSON, and
+# --compare prints the change against the results of an earlier run.
+#
+#   python benchmarks/suite.py --rows 10000,100000,1000000 --output results.json
+#   python benchmarks/suite.py --rows 10000,100000 --compare results.json
+#
+# 10M rows work too, but generating the synthetic tables alone takes minutes
+# and several GB of memory.
+
+app_path = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, app_path)
+sys.path.insert(0, dirname(abspath(__file__)))
+
+# Share of the rows in each metadata file, and its seed (seeds keep mmp_IDs apart)
+databases = [('MarRef', 0.1, 1), ('MarDB', 0.9, 2)]
+
+# Filter states for the index benchmarks: (name, changes to the default state)
+states = [
+    ('default', {}),
+    ('qs', {'qs': (50, 100)}),
+    ('contigs', {'contigs': (1, 100)}),
+    ('database', {'database': 'MarDB'}),
+    ('combined', {'qs': (50, 100), 'contigs': (1, 500), 'database': 'MarDB', 'analysis_type': 'Metagenome assembled genome (MAG)'}),
+]
+
+
+class Results(object):
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.entries = []
+
+    def add(self, rows, group, name, **values):
+        self.entries.append(dict(rows=rows, group=group, name=name, **values))
+        print("%9d  %-8s %-44s %s" % (rows, group, name, "  ".join(
+            ("%.4fs" if key == 'seconds' else "%d") % value + ("" if key == 'seconds' else " " + key) for key, value in sorted(values.items()))))
+
+    def time(self, rows, group, name, function, setup=None):
+        # Best of `repeat` runs; setup() runs before each, untimed. Returns the last result
+        best = None
+        for i in range(self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        self.add(rows, group, name, seconds=best)
+        return result
+
+
+def metadata_files(directory, rows):
+    import synthetic
+    paths = {}
+    for db, share, seed in databases:
+        paths[db] = synthetic.write_metadata(join(directory, db + '.tsv'), max(1, int(rows * share)), seed)
+    return paths
+
+
+def touch_rows(path, share, seed):
+    # Change one metadata field of `share` of the rows, for the incremental ETL
+    import numpy as np
+    import pandas
+    metadata = pandas.read_csv(path, sep='\t')
+    rng = np.random.default_rng(seed)
+    changed = rng.random(len(metadata)) < share
+    metadata.loc[changed, 'genome_length'] = pandas.to_numeric(metadata['genome_length'], errors='coerce')[changed].fillna(0) + 1
+    metadata.to_csv(path, sep='\t', index=False, na_rep='missing')
+
+
+def bench_etl(results, rows, directory):
+    import classify
+    import pandas
+    import update_and_deploy_input_data as etl
+
+    paths = metadata_files(directory, rows)
+    frames = {}
+    for db, path in paths.items():
+        metadata = results.time(rows, 'etl', 'read_csv %s' % db, lambda: pandas.read_csv(path, sep='\t'))
+        frames[db] = results.time(rows, 'etl', 'parse_metadata %s' % db, lambda: etl.parse_metadata(db, metadata.copy()))
+    complete_df = results.time(rows, 'etl', 'concat', lambda: pandas.concat(list(frames.values()), ignore_index=True))
+    complete_df = results.time(rows, 'etl', 'classify', lambda: classify.classify(complete_df.copy()))
+    output = join(directory, 'input.tsv')
+    results.time(rows, 'etl', 'write input.tsv', lambda: complete_df.to_csv(output, sep='\t'))
+    results.add(rows, 'etl', 'input.tsv size', bytes=os.path.getsize(output))
+    results.time(rows, 'etl', 'build (end to end)', lambda: etl.build(paths))
+
+    incremental = join(directory, 'incremental', 'input.tsv')
+
+    def clean():
+        shutil.rmtree(dirname(incremental), ignore_errors=True)
+        os.makedirs(dirname(incremental))
+
+    results.time(rows, 'etl', 'incremental first run', lambda: etl.update_incremental(paths, incremental, 100000, 2), setup=clean)
+    results.time(rows, 'etl', 'incremental unchanged', lambda: etl.update_incremental(paths, incremental, 100000, 2))
+    touch_rows(paths['MarDB'], 0.01, 0)
+    # Only the first repeat sees changed rows, so this one runs once
+    start = time.perf_counter()
+    etl.update_incremental(paths, incremental, 100000, 2)
+    results.add(rows, 'etl', 'incremental 1% changed', seconds=time.perf_counter() - start)
+    return output
+
+
+def bench_filters(results, rows, dataset):
+    import filterindex
+
+    default = filterindex.FilterState(
+        database='All', analysis_type='All', draft='All',
+        qs=tuple(dataset.bounds['QS']), contigs=tuple(dataset.bounds['contigs']), length=tuple(dataset.bounds['Assembly_length']))
+    for name, changes in states:
+        state = default._replace(**changes)
+        selected = results.time(rows, 'filter', 'select %s (cold)' % name, lambda: filterindex.Selection(dataset.index).select(state))
+        results.add(rows, 'filter', 'select %s rows' % name, rows_selected=len(selected))
+        # One widget moved since the last update: only that field's mask is recomputed
+        selection = filterindex.Selection(dataset.index)
+        moved = state._replace(qs=(state.qs[0] + 1, state.qs[1]))
+        results.time(rows, 'filter', 'select %s (one field moved)' % name, lambda: selection.select(moved), setup=lambda: selection.select(state))
+
+
+def bench_sessions(results, rows, modes):
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+    from bokeh.document.events import DocumentPatchedEvent
+    from bokeh.models.widgets import InputWidget, Slider
+    import bench_payload
+    import datastore
+    import settings
+
+    application = Application(DirectoryHandler(filename=app_path))
+    for mode in modes:
+        settings.filter_mode = mode
+        # First visitor of a widget state, then one finding its results in the filter cache
+        doc = results.time(rows, mode, 'session start', application.create_document, setup=lambda: datastore.get().results.clear())
+        results.time(rows, mode, 'session start (filter cache hit)', application.create_document)
+        results.add(rows, mode, 'initial document', bytes=len(doc.to_json_string()))
+        widgets = dict((model.title, model) for model in doc.select({'type': (InputWidget, Slider)}))
+        for name, value in bench_payload.interactions:
+            target = widgets[bench_payload.titles[name]]
+            events = []
+            record = events.append
+            doc.on_change(record)
+            start = time.perf_counter()
+            target.value = value
+            bench_payload.flush(doc)
+            elapsed = time.perf_counter() - start
+            doc.remove_on_change(record)
+            events = [event for event in events if isinstance(event, DocumentPatchedEvent) and getattr(event, 'model', None) is not target]
+            start = time.perf_counter()
+            size = bench_payload.message_size(events) if events else 0
+            serialize = time.perf_counter() - start
+            results.add(rows, mode, 'update %s=%s' % (name, value), seconds=elapsed)
+            results.add(rows, mode, 'patch %s=%s' % (name, value), bytes=size)
+            results.add(rows, mode, 'serialize %s=%s' % (name, value), seconds=serialize)
+
+
+def metadata(args):
+    import bokeh
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=app_path, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'machine': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'bokeh': bokeh.__version__,
+        'repeat': args.repeat,
+        'modes': args.modes.split(','),
+    }
+
+
+def compare(entries, path):
+    # Ratio new/old of every measurement present in both runs
+    with open(path) as handle:
+        previous = json.load(handle)
+    old = dict(((entry['rows'], entry['group'], entry['name']), entry) for entry in previous['results'])
+    print("\nCompared with %s (commit %s):" % (path, previous['meta'].get('commit')))
+    for entry in entries:
+        before = old.get((entry['rows'], entry['group'], entry['name']))
+        for key in ['seconds', 'bytes']:
+            if before and before.get(key) and key in entry:
+                print("%9d  %-8s %-44s %-7s %6.2fx" % (entry['rows'], entry['group'], entry['name'], key, entry[key] / before[key]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='10000,100000,1000000', help="comma separated dataset sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="timings are the best of this many runs")
+    parser.add_argument('--modes', default='data,view,client', help="filter modes of the session benchmarks")
+    parser.add_argument('--skip', default='', help="comma separated groups to skip: etl, filter, sessions")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="results of an earlier run")
+    args = parser.parse_args()
+    skip = set(args.skip.split(','))
+
+    tmp = tempfile.mkdtemp()
+    os.environ['MMP_INPUT_PATH'] = join(tmp, 'input.tsv')
+    import columnar
+    import datastore
+    import synthetic
+
+    results = Results(args.repeat)
+    try:
+        for rows in [int(value) for value in args.rows.split(',')]:
+            directory = join(tmp, str(rows))
+            os.makedirs(directory)
+            if 'etl' in skip:
+                output = synthetic.write_input(join(directory, 'input.tsv'), rows)
+            else:
+                output = bench_etl(results, rows, directory)
+            results.time(rows, 'load', 'datastore.read tsv', lambda: datastore.read(output))
+            compact = results.time(rows, 'etl', 'columnar.convert', lambda: columnar.convert(output))
+            results.add(rows, 'etl', 'input.col size', bytes=os.path.getsize(compact))
+            # The app loads the compact copy once there is one
+            dataset = results.time(rows, 'load', 'datastore.read compact', lambda: datastore.read(output))
+            datastore.swap(dataset)
+            if 'filter' not in skip:
+                bench_filters(results, rows, dataset)
+            if 'sessions' not in skip:
+                bench_sessions(results, rows, args.modes.split(','))
+            datastore.reset()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(args.output, 'w') as handle:
+        json.dump({'meta': metadata(args), 'results': results.entries}, handle, indent=1)
+    print("Results written to %s" % args.output)
+    if args.compare:
+        compare(results.entries, args.compare)
+
+
+if __name__ == '__main__':
+    main()
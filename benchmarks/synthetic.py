@@ -0,0 +1,78 @@
+import numpy as np
+import pandas
+
+# Seeded generator for synthetic tables shaped like inputdata/input.tsv
+
+types = ['Whole genome sequencing (WGS)', 'Metagenome assembled genome (MAG)', 'Single amplified genome (SAG)', 'missing']
+qualities = ['Finished', 'High Quality Draft', 'Near Complete', 'Medium Quality Draft', 'Low Quality Draft', 'Very Low Quality Draft', 'NA']
+colors = {'MarRef': 'blue', 'MarDB': 'green'}
+alphas = {'Whole genome sequencing (WGS)': 1, 'Metagenome assembled genome (MAG)': 0.6, 'Single amplified genome (SAG)': 0.4}
+
+
+def numeric(rng, rows, low, high, missing=0.05):
+    values = rng.uniform(low, high, rows)
+    values[rng.random(rows) < missing] = np.nan
+    return values
+
+
+def input_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pandas.DataFrame()
+    DB = np.where(rng.random(rows) < 0.1, 'MarRef', 'MarDB')
+    apt = rng.choice(types, rows, p=[0.6, 0.3, 0.08, 0.02])
+    frame['mmp_ID'] = ['MMP%08d' % i for i in range(rows)]
+    frame['analysis_project_type'] = apt
+    frame['full_scientific_name'] = ['Synthetic bacterium strain %d' % i for i in rng.integers(0, rows, rows)]
+    rrnas = rng.integers(0, 10, (rows, 3))
+    frame['rrnas'] = ['%d,%d,%d' % tuple(r) for r in rrnas]
+    for name in ['depth', 'env_salinity', 'env_temp', 'sequencing_depth', 'optimal_temperature']:
+        frame[name] = numeric(rng, rows, 0, 100, missing=0.5)
+    for name in ['num_replicons', 'plasmids']:
+        frame[name] = np.floor(numeric(rng, rows, 1, 10))
+    frame['genes'] = np.floor(numeric(rng, rows, 500, 10000))
+    frame['cds'] = np.floor(frame['genes'] * 0.9)
+    frame['pseudo_genes'] = np.floor(numeric(rng, rows, 0, 300))
+    frame['Total_tRNAs'] = np.floor(numeric(rng, rows, 0, 80))
+    frame['Unique_tRNAs'] = np.floor(numeric(rng, rows, 0, 21))
+    frame['frameshifted_genes'] = np.floor(numeric(rng, rows, 0, 50))
+    frame['Assembly_length'] = np.floor(numeric(rng, rows, 2e5, 1.2e7, missing=0.01))
+    frame['GC'] = numeric(rng, rows, 20, 75)
+    frame['contigs'] = np.floor(numeric(rng, rows, 1, 3000, missing=0.01))
+    frame['Completeness'] = numeric(rng, rows, 0, 100)
+    frame['Contamination'] = numeric(rng, rows, 0, 30)
+    frame['Strain_heterogeneity'] = numeric(rng, rows, 0, 100)
+    frame['QS'] = frame['Completeness'] - 5 * frame['Contamination']
+    frame['DB'] = DB
+    frame['db'] = frame['DB'].str.lower()
+    frame['rRNA5S'] = rrnas[:, 0]
+    frame['rRNA16S'] = rrnas[:, 1]
+    frame['rRNA23S'] = rrnas[:, 2]
+    frame['quality'] = np.where(DB == 'MarRef', 'Finished', rng.choice(qualities[1:], rows))
+    frame['color'] = [colors[d] if a != 'missing' else 'grey' for d, a in zip(DB, apt)]
+    frame['alpha'] = [alphas.get(a, 1) for a in apt]
+    frame['label'] = ['%s (%s)' % (d, a) if a != 'missing' else '%s (Unknown type)' % d for d, a in zip(DB, apt)]
+    return frame
+
+
+def write_input(path, rows, seed=0):
+    input_frame(rows, seed).to_csv(path, sep='\t')
+    return path
+
+
+def metadata_frame(rows, seed=0):
+    # Table shaped like the MarRef/MarDB Current.tsv metadata files read by the ETL
+    from update_and_deploy_input_data import strheadermap, floatheadermap
+    frame = input_frame(rows, seed)
+    metadata = pandas.DataFrame()
+    for new, old in strheadermap.items():
+        metadata[old] = frame[new]
+    for new, old in floatheadermap.items():
+        metadata[old] = frame[new]
+    metadata['mmp_ID'] = ['MMP%d%07d' % (seed, i) for i in range(rows)]
+    return metadata
+
+
+def write_metadata(path, rows, seed=0):
+    # Missing values are written as 'missing', like upstream
+    metadata_frame(rows, seed).to_csv(path, sep='\t', index=False, na_rep='missing')
+    return path
@@ -0,0 +1,106 @@
+import operator
+
+import numpy as np
+
+# Table driven classification of the derived columns in input.tsv.
+# Each table is an ordered list of (value, conditions); the first rule whose
+# conditions all hold sets the value for a row, rows matching no rule get the
+# default. Conditions are (column, operator, operand) triples and are evaluated
+# as whole-column masks, so comparisons against missing values (NaN) are False.
+
+operators = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+WGS = 'Whole genome sequencing (WGS)'
+MAG = 'Metagenome assembled genome (MAG)'
+SAG = 'Single amplified genome (SAG)'
+
+# Draft quality (MIMAG-like) based on CheckM estimates, rRNAs and tRNAs
+quality_rules = [
+    ('Finished', [('DB', '==', 'MarRef')]),
+    ('NA', [('Completeness', '==', 'missing')]),
+    ('NA', [('Contamination', '==', 'missing')]),
+    ('High Quality Draft', [('Completeness', '>', 90), ('Contamination', '<', 5), ('rRNA5S', '>', 1), ('rRNA16S', '>', 1), ('rRNA23S', '>', 1), ('Unique_tRNAs', '>', 17)]),
+    ('Near Complete', [('Completeness', '>', 90), ('Contamination', '<', 5)]),
+    ('Medium Quality Draft', [('Completeness', '>=', 50), ('Contamination', '<', 10)]),
+    ('Low Quality Draft', [('Completeness', '<', 50), ('Contamination', '<', 10)]),
+    ('Very Low Quality Draft', [('Contamination', '>', 10)]),
+]
+
+# Individual colors for discrete databases
+color_rules = [
+    ('grey', [('DB', '==', 'MarRef'), ('analysis_project_type', '==', 'missing')]),
+    ('grey', [('DB', '==', 'MarDB'), ('analysis_project_type', '==', 'missing')]),
+    ('blue', [('DB', '==', 'MarRef')]),
+    ('green', [('DB', '==', 'MarDB')]),
+]
+
+# Alphas for analysis_project_type
+alpha_rules = [
+    (1, [('analysis_project_type', '==', WGS)]),
+    (0.6, [('analysis_project_type', '==', MAG)]),
+    (0.4, [('analysis_project_type', '==', SAG)]),
+]
+
+# Labels for the legend
+label_rules = [
+    ('MarRef (Unknown type)', [('DB', '==', 'MarRef'), ('analysis_project_type', '==', 'missing')]),
+    ('MarDB (Unknown type)', [('DB', '==', 'MarDB'), ('analysis_project_type', '==', 'missing')]),
+]
+for apt in [WGS, MAG, SAG]:
+    for DB in ['MarRef', 'MarDB']:
+        label_rules.append(('%s (%s)' % (DB, apt), [('DB', '==', DB), ('analysis_project_type', '==', apt)]))
+
+# Derived column name, rules and default, in the order they are added to input.tsv
+derived_columns = [
+    ('quality', quality_rules, 'NA'),
+    ('color', color_rules, 'grey'),
+    ('alpha', alpha_rules, 1),
+    ('label', label_rules, 'Unknown'),
+]
+
+
+def condition_mask(frame, conditions, cache=None):
+    # cache maps (column, op, operand) to its mask, so conditions shared between rules and tables are evaluated once
+    cache = {} if cache is None else cache
+    mask = np.ones(len(frame), dtype=bool)
+    for condition in conditions:
+        if condition not in cache:
+            column, op, operand = condition
+            cache[condition] = np.asarray(operators[op](frame[column], operand), dtype=bool)
+        mask &= cache[condition]
+    return mask
+
+
+def apply_rules(frame, rules, default, cache=None):
+    values = np.array([value for value, conditions in rules] + [default])
+    result = np.full(len(frame), default, dtype=values.dtype if values.dtype.kind in 'biuf' else object)
+    # Rows already claimed by an earlier rule
+    assigned = np.zeros(len(frame), dtype=bool)
+    used = []
+    for value, conditions in rules:
+        mask = condition_mask(frame, conditions, cache) & ~assigned
+        result[mask] = value
+        assigned |= mask
+        if mask.any():
+            used.append(value)
+    if not assigned.all():
+        used.append(default)
+    if result.dtype.kind in 'biuf' and used:
+        # Like a column built from a list of the values: integers unless a float was assigned
+        result = result.astype(np.array(used).dtype)
+    return result
+
+
+def classify(frame):
+    # Add (or overwrite) every derived column in place
+    cache = {}
+    for name, rules, default in derived_columns:
+        frame[name] = apply_rules(frame, rules, default, cache)
+    return frame
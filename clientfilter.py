@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+from bokeh.models import CustomJSFilter
+
+import filterindex
+import search
+
+# Browser side filtering (settings.filter_mode == 'client'). The range columns
+# and one bit set per categorical filter are shipped with the plot's data
+# source once, and the same filters as filterindex.Selection run in a
+# CustomJSFilter, so moving a widget needs no round trip to the server.
+
+
+def filter_columns(dataset):
+    # Extra data source columns: f_<field> for every filter in filterindex
+    columns = {}
+    for field, column in filterindex.range_filters:
+        columns['f_' + field] = np.asarray(dataset.column(column), dtype=float)
+    for field, (column, values) in filterindex.category_filters:
+        # Bit n is set when the row matches the n-th widget value of this filter
+        bits = np.zeros(len(dataset), dtype=np.uint8)
+        for bit, value in enumerate(values):
+            bits |= dataset.index.category_mask(field, value).astype(np.uint8) << bit
+        columns['f_' + field] = bits
+    # Search box text: lowercased "<scientific name>\n<MMP ID>" per row, see search.py
+    columns['f_search'] = search_texts(dataset)
+    return columns
+
+
+def search_texts(dataset):
+    # Computed once per dataset, shared by every session and reload in this process
+    def compute(dataset):
+        parts = []
+        for name in search.search_columns:
+            values = dataset.take(slice(None), [name])[name]
+            parts.append(['' if value != value else str(value).lower() for value in values])
+        return np.array(['\n'.join(row) for row in zip(*parts)], dtype=object)
+    return dataset.derived('client_search', compute)
+
+
+code = """
+const data = source.data;
+const bits = %(bits)s;
+const ranges = [%(ranges)s];
+const categories = [%(categories)s];
+const n = source.get_length();
+const indices = [];
+let missing = 0;
+// Search box, like search.SearchIndex: a prefix of the name or ID for short
+// queries, a substring of either otherwise
+const query = search.value_input.trim().toLowerCase();
+const short = query.length < %(gram)d;
+for (let i = 0; i < n; i++) {
+    let keep = true;
+    if (query.length > 0) {
+        const text = data.f_search[i];
+        keep = short ? text.startsWith(query) || text.includes("\\n" + query) : text.includes(query);
+    }
+    for (let r = 0; keep && r < ranges.length; r++) {
+        const [column, low, high] = ranges[r];
+        const value = column[i];
+        if (value == null || !(value >= low && value <= high)) {
+            keep = false;
+            break;
+        }
+    }
+    for (let c = 0; keep && c < categories.length; c++) {
+        const [column, bit] = categories[c];
+        if (bit !== undefined && !((column[i] >> bit) & 1))
+            keep = false;
+    }
+    if (keep) {
+        indices.push(i);
+        if (data.x[i] == null || isNaN(data.x[i]) || data.y[i] == null || isNaN(data.y[i]))
+            missing++;
+    }
+}
+const filtered = n - indices.length + missing;
+title.text = "Showing " + (n - filtered) + " entries out of " + n + ". (" + filtered + " entries are filtered using widgets or have missing data for either X or Y)";
+return indices;
+"""
+
+
+def filter_code():
+    bits = dict((field, dict((value, bit) for bit, value in enumerate(values))) for field, (column, values) in filterindex.category_filters)
+    ranges = ", ".join("[data.f_%s, %s_min.value, %s_max.value]" % (field, field, field) for field, column in filterindex.range_filters)
+    # "All" is not in bits, so its bit is undefined and the filter is skipped
+    categories = ", ".join("[data.f_%s, bits.%s[%s.value]]" % (field, field, field) for field, category in filterindex.category_filters)
+    return code % dict(bits=json.dumps(bits), ranges=ranges, categories=categories, gram=search.gram)
+
+
+def make_filter(widgets, title):
+    # widgets maps <field>_min/<field>_max (sliders), <field> (selects) and search
+    # (the search box) to the session's widgets
+    args = dict(widgets)
+    args['title'] = title
+    return CustomJSFilter(args=args, code=filter_code())
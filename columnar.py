@@ -0,0 +1,336 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas
+
+import filterindex
+
+# Compact, typed columnar copy of input.tsv (input.col), written by
+# update_and_deploy_input_data.py and memory-mapped by datastore.read().
+#
+# Layout:
+#   8 bytes  magic
+#   8 bytes  header length (little endian)
+#   header   JSON: format version, row count and one entry per column with its
+#            encoding, dtype and position
+#   padding  to a multiple of `alignment`, then the column data, every column
+#            starting at a multiple of `alignment`
+#
+# Numeric columns are stored in the narrowest dtype that holds every value
+# exactly (integers without missing values as int8..int64, else float32 when
+# lossless, else float64). Text columns are dictionary encoded: integer codes
+# (-1 for missing) plus the distinct values, NUL separated UTF-8, which are only
+# turned into Python strings when a column is used (see strings()).
+#
+# The file also holds the range filter index of every column in
+# filterindex.range_filters (sorted permutation, sorted values and a mask of
+# the rows with a value), so server processes map it instead of sorting the
+# columns each: every process started on the same file shares those pages.
+#
+#   python columnar.py inputdata/input.tsv   (writes inputdata/input.col)
+
+magic = b'MMPCOLS\x00'
+format_version = 1
+alignment = 64
+
+
+def path_for(path):
+    # Compact copy of a dataset file: input.tsv -> input.col
+    return os.path.splitext(path)[0] + '.col'
+
+
+def is_columnar(path):
+    with open(path, 'rb') as handle:
+        return handle.read(len(magic)) == magic
+
+
+def aligned(offset):
+    return -(-offset // alignment) * alignment
+
+
+def int_dtype(low, high):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def narrow(values):
+    # values in the narrowest dtype that keeps every value (and NaN) exactly
+    if values.dtype.kind == 'b':
+        return values
+    if values.dtype.kind in 'iu':
+        return values.astype(int_dtype(values.min(), values.max())) if len(values) else values.astype(np.int8)
+    values = values.astype(np.float64)
+    finite = values[np.isfinite(values)]
+    if len(finite) == len(values) and np.array_equal(np.floor(finite), finite):
+        return narrow(finite.astype(np.int64)) if len(finite) else values.astype(np.int8)
+    single = values.astype(np.float32)
+    if np.array_equal(single.astype(np.float64), values, equal_nan=True):
+        return single
+    return values
+
+
+def encode(values):
+    # (codes, distinct values) of a text column, missing values are -1
+    codes, uniques = pandas.factorize(values)
+    uniques = [str(value) for value in uniques]
+    return codes.astype(int_dtype(-1, len(uniques))), uniques
+
+
+def strings(values):
+    # Distinct values of a dictionary encoded column, from the NUL separated UTF-8 bytes
+    return values.tobytes().decode('utf-8').split('\x00') if len(values) else []
+
+
+class Table(object):
+    # Columns of a compact dataset file: numeric columns in `arrays`, text
+    # columns as (codes, encoded values) in `encoded`, see strings(), and the
+    # range filter indexes as (order, sorted, valid) in `indexes`. Arrays are
+    # read-only views of the memory-mapped file
+
+    def __init__(self, rows, names, arrays, encoded, header, indexes=None):
+        self.rows = rows
+        self.names = names
+        self.arrays = arrays
+        self.encoded = encoded
+        self.header = header
+        self.indexes = indexes or {}
+
+    def __len__(self):
+        return self.rows
+
+
+def write(frame, path):
+    # Write `frame` to `path` (atomically, via <path>.part)
+    frame = frame.drop(columns=[name for name in frame.columns if str(name).startswith('Unnamed: ')])
+    blobs = []
+    columns = []
+    offset = 0
+
+    def add(data):
+        nonlocal offset
+        start = aligned(offset)
+        blobs.append((start, data))
+        offset = start + len(data)
+        return start
+
+    def array(values):
+        values = np.ascontiguousarray(values)
+        return {'dtype': values.dtype.str, 'offset': add(values.tobytes()), 'count': len(values)}
+
+    indexes = []
+    for name in frame.columns:
+        values = frame[name].values
+        if values.dtype.kind in 'biuf':
+            entry = {'name': name, 'encoding': 'plain'}
+            entry.update(array(narrow(values)))
+            columns.append(entry)
+            if name in [column for field, column in filterindex.range_filters]:
+                order, ordered, valid = filterindex.range_arrays(np.asarray(values, dtype=float))
+                indexes.append({'column': name, 'order': array(order), 'sorted': array(ordered), 'valid': array(valid)})
+        else:
+            codes, uniques = encode(values)
+            strings = '\x00'.join(uniques).encode('utf-8')
+            columns.append({
+                'name': name,
+                'encoding': 'dictionary',
+                'dtype': codes.dtype.str,
+                'offset': add(codes.tobytes()),
+                'count': len(codes),
+                'values_offset': add(strings),
+                'values_nbytes': len(strings),
+                'values_count': len(uniques),
+            })
+    header = json.dumps({'format': format_version, 'rows': len(frame), 'columns': columns, 'indexes': indexes}).encode('utf-8')
+    data_start = aligned(len(magic) + 8 + len(header))
+
+    with open(path + '.part', 'wb') as handle:
+        handle.write(magic)
+        handle.write(struct.pack('<Q', len(header)))
+        handle.write(header)
+        for start, data in blobs:
+            handle.seek(data_start + start)
+            handle.write(data)
+        handle.truncate(data_start + offset)
+    os.replace(path + '.part', path)
+    return path
+
+
+def read(path):
+    with open(path, 'rb') as handle:
+        if handle.read(len(magic)) != magic:
+            raise ValueError("%s is not a compact dataset file" % path)
+        size, = struct.unpack('<Q', handle.read(8))
+        header = json.loads(handle.read(size).decode('utf-8'))
+    if header['format'] > format_version:
+        raise ValueError("%s has format %d, this version reads up to %d" % (path, header['format'], format_version))
+    data_start = aligned(len(magic) + 8 + size)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) > data_start else np.zeros(data_start, dtype=np.uint8)
+
+    def view(dtype, offset, count):
+        dtype = np.dtype(dtype)
+        start = data_start + offset
+        return np.asarray(buffer[start:start + dtype.itemsize * count]).view(dtype)
+
+    names, arrays, encoded = [], {}, {}
+    for column in header['columns']:
+        names.append(column['name'])
+        values = view(column['dtype'], column['offset'], column['count'])
+        if column['encoding'] == 'dictionary':
+            encoded[column['name']] = (values, view(np.uint8, column['values_offset'], column['values_nbytes']))
+        else:
+            arrays[column['name']] = values
+    indexes = {}
+    for index in header.get('indexes', []):
+        indexes[index['column']] = tuple(view(**index[part]) for part in ('order', 'sorted', 'valid'))
+    return Table(header['rows'], names, arrays, encoded, header, indexes)
+
+
+def column_kind(values):
+    # 'bool', 'number' or 'text' for a column of one chunk of rows, None for a
+    # float column without any value, which pandas reads as either
+    kind = values.dtype.kind
+    if kind == 'b':
+        return 'bool'
+    if kind in 'iuf':
+        return None if kind == 'f' and np.isnan(values).all() else 'number'
+    return 'text'
+
+
+def write_chunks(chunks, path):
+    # Write the DataFrames of chunks() (consecutive rows of one table) to path,
+    # the same file write() makes of all of them concatenated. The chunks are
+    # read twice: once to find each column's dtype and distinct text values,
+    # then to write every chunk in place. Memory holds one chunk, the distinct
+    # text values and the range filter column being indexed, not the table.
+    # Returns None without writing when a column is numeric in some chunks and
+    # text in others, which pandas reads as a column of mixed objects
+    names, rows, kinds, numbers, texts = None, 0, {}, {}, {}
+    for frame in chunks():
+        frame = frame.drop(columns=[name for name in frame.columns if str(name).startswith('Unnamed: ')])
+        names = names or list(frame.columns)
+        for name in names:
+            values = frame[name].values
+            kind = column_kind(values)
+            kinds.setdefault(name, set()).add(kind)
+            if kind == 'text':
+                distinct = texts.setdefault(name, {})
+                for value in pandas.factorize(values)[1]:
+                    distinct.setdefault(value, len(distinct))
+            elif kind != 'bool':
+                # What narrow() needs to know about the whole column
+                floats = values.astype(np.float64)
+                finite = floats[np.isfinite(floats)]
+                stats = numbers.setdefault(name, {'integer': True, 'integral': True, 'single': True, 'complete': True, 'low': None, 'high': None, 'valid': 0})
+                stats['integer'] &= values.dtype.kind in 'iu'
+                stats['integral'] &= bool(np.array_equal(np.floor(finite), finite))
+                stats['single'] &= bool(np.array_equal(floats.astype(np.float32).astype(np.float64), floats, equal_nan=True))
+                stats['complete'] &= len(finite) == len(floats)
+                stats['valid'] += int(np.count_nonzero(~np.isnan(floats)))
+                if len(finite):
+                    low, high = (values.min(), values.max()) if values.dtype.kind in 'iu' else (int(finite.min()), int(finite.max()))
+                    stats['low'] = low if stats['low'] is None else min(stats['low'], low)
+                    stats['high'] = high if stats['high'] is None else max(stats['high'], high)
+        rows += len(frame)
+    if names is None:
+        return None
+
+    # Layout, in the order write() places the arrays
+    offset = 0
+
+    def place(nbytes):
+        nonlocal offset
+        start = aligned(offset)
+        offset = start + nbytes
+        return start
+
+    def array(dtype, count):
+        return {'dtype': np.dtype(dtype).str, 'offset': place(np.dtype(dtype).itemsize * count), 'count': count}
+
+    columns, indexes, strings = [], [], {}
+    for name in names:
+        found = kinds[name] - set([None])
+        if len(found) > 1 or ('bool' in found and None in kinds[name]):
+            return None
+        if found == set(['text']):
+            strings[name] = '\x00'.join(str(value) for value in texts[name]).encode('utf-8')
+            entry = {'name': name, 'encoding': 'dictionary'}
+            entry.update(array(int_dtype(-1, len(texts[name])), rows))
+            entry.update(values_offset=place(len(strings[name])), values_nbytes=len(strings[name]), values_count=len(texts[name]))
+            columns.append(entry)
+            continue
+        stats = numbers.get(name)
+        if found == set(['bool']):
+            dtype = np.bool_
+        elif stats['integer'] or (stats['complete'] and stats['integral']):
+            dtype = int_dtype(stats['low'], stats['high']) if stats['low'] is not None else np.int8
+        else:
+            dtype = np.float32 if stats['single'] else np.float64
+        entry = {'name': name, 'encoding': 'plain'}
+        entry.update(array(dtype, rows))
+        columns.append(entry)
+        if name in [column for field, column in filterindex.range_filters]:
+            order = np.int32 if rows < 2 ** 31 else np.int64
+            indexes.append({'column': name, 'order': array(order, stats['valid']), 'sorted': array(np.float64, stats['valid']), 'valid': array(np.bool_, rows)})
+    header = json.dumps({'format': format_version, 'rows': rows, 'columns': columns, 'indexes': indexes}).encode('utf-8')
+    data_start = aligned(len(magic) + 8 + len(header))
+
+    with open(path + '.part', 'w+b') as handle:
+        def put(start, values):
+            handle.seek(data_start + start)
+            handle.write(np.ascontiguousarray(values).tobytes())
+
+        handle.write(magic)
+        handle.write(struct.pack('<Q', len(header)))
+        handle.write(header)
+        for entry in columns:
+            if entry['encoding'] == 'dictionary':
+                put(entry['values_offset'], np.frombuffer(strings[entry['name']], dtype=np.uint8))
+        start = 0
+        for frame in chunks():
+            for entry in columns:
+                values = frame[entry['name']].values
+                dtype = np.dtype(entry['dtype'])
+                if entry['encoding'] == 'dictionary':
+                    # Codes of this chunk -> codes of the whole column, missing values stay -1
+                    codes, uniques = pandas.factorize(values)
+                    lookup = np.array([texts[entry['name']][value] for value in uniques] + [-1], dtype=dtype)
+                    values = lookup[codes]
+                elif values.dtype.kind == 'f' and dtype.kind in 'iu':
+                    values = values.astype(np.int64)
+                put(entry['offset'] + start * dtype.itemsize, values.astype(dtype))
+            start += len(frame)
+        if start != rows:
+            raise ValueError("rows changed while writing %s" % path)
+        # Range filter indexes of the columns just written, one column at a time
+        for index in indexes:
+            entry = [entry for entry in columns if entry['name'] == index['column']][0]
+            handle.seek(data_start + entry['offset'])
+            values = np.fromfile(handle, dtype=entry['dtype'], count=rows)
+            for part, values in zip(('order', 'sorted', 'valid'), filterindex.range_arrays(np.asarray(values, dtype=float))):
+                put(index[part]['offset'], values)
+        handle.truncate(data_start + offset)
+    os.replace(path + '.part', path)
+    return path
+
+
+def convert(path, target=None, chunk_size=None):
+    # Write the compact copy of a dataset TSV (to path_for(path) by default), with
+    # the types pandas reads it with. With chunk_size it is read in chunks of
+    # that many rows (see write_chunks()), else at once
+    target = target or path_for(path)
+    if chunk_size:
+        written = write_chunks(lambda: pandas.read_csv(path, sep='\t', chunksize=chunk_size), target)
+        if written:
+            return written
+    return write(pandas.read_csv(path, sep='\t'), target)
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print("Wrote %s" % convert(path))
@@ -0,0 +1,232 @@
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas
+
+import columnar
+import filterindex
+import manifest
+import settings
+
+# Process-wide dataset store. "bokeh serve" re-runs main.py for every browser
+# session, but modules imported from it are only imported once per process, so
+# the parsed dataset lives here and is shared (read-only) by all sessions.
+
+# Columns used to set the slider bounds
+range_columns = ['QS', 'contigs', 'Assembly_length']
+
+# Columns with a handful of distinct values, also kept as integer codes
+category_columns = ['DB', 'analysis_project_type', 'quality']
+
+_lock = threading.Lock()
+_current = None
+# Text files read by every session (path -> (mtime, text)), see text()
+_texts = {}
+# Session documents -> callback to run on them after a new dataset was swapped in
+_listeners = weakref.WeakKeyDictionary()
+
+
+class Dataset(object):
+
+    def __init__(self, frame, path=None, signature=None, manifest=None):
+        # frame is a pandas DataFrame (input.tsv) or a columnar.Table (input.col),
+        # manifest the ETL's description of that file (manifest.py) if there is one
+        self.path = path
+        # Identity of the file this was read from, see signature()
+        self.signature = signature
+        # Data version, changes whenever a new file is loaded
+        self.version = signature[1] if signature else 0
+        self.total = len(frame)
+        # Column names in file order
+        self.names = list(frame.names if isinstance(frame, columnar.Table) else frame.columns)
+        # Keep every column as a read-only numpy array (columnar, no pandas overhead per session)
+        self.columns = {}
+        # Dictionary encoded columns of a compact file (see columnar.Table), decoded on first use
+        self.encoded = {}
+        self._lookups = {}
+        # Column -> (order, sorted, valid) of the range filter index stored in a compact file
+        self.range_indexes = {}
+        if isinstance(frame, columnar.Table):
+            self.columns.update(frame.arrays)
+            self.encoded.update(frame.encoded)
+            self.range_indexes.update(frame.indexes)
+        else:
+            for name in frame.columns:
+                values = np.array(frame[name].values)
+                values.setflags(write=False)
+                self.columns[name] = values
+        # Slider bounds, from the manifest or scanned once instead of once per session
+        self.bounds = {}
+        for name in range_columns:
+            if manifest is not None and name in manifest['sliders']:
+                self.bounds[name] = tuple(manifest['sliders'][name])
+            elif name in self.range_indexes and len(self.range_indexes[name][1]):
+                # First and last value of the stored sorted column
+                ordered = self.range_indexes[name][1]
+                self.bounds[name] = (float(ordered[0]), float(ordered[-1]))
+            else:
+                self.bounds[name] = (float(np.nanmin(self.column(name))), float(np.nanmax(self.column(name))))
+        # Integer code per row and the value of each code (missing values are -1)
+        self.categories = {}
+        for name in category_columns:
+            if name in self.encoded:
+                codes, values = self.encoded[name][0], columnar.strings(self.encoded[name][1])
+            else:
+                codes, values = pandas.factorize(self.columns[name])
+            codes = codes.astype(np.int8 if len(values) < 128 else np.int32, copy=False)
+            codes.setflags(write=False)
+            self.categories[name] = (codes, list(values))
+        # Sorted permutations used by select_entries(), see range_indexes
+        self.index = filterindex.FilterIndex(self)
+        # Rows and statistics per widget state, shared by the sessions using this
+        # dataset. A reload creates a new Dataset, so results never outlive their data version
+        self.results = filterindex.ResultCache(int(settings.filter_cache_mb * 2 ** 20))
+        # Arrays derived from the columns on first use, see derived()
+        self._derived = {}
+
+    def __len__(self):
+        return self.total
+
+    def column(self, name):
+        if name not in self.columns:
+            # Dictionary encoded column, decoded once on first use
+            decoded = self.decode(name, slice(None))
+            decoded.setflags(write=False)
+            self.columns[name] = decoded
+        return self.columns[name]
+
+    def decode(self, name, rows):
+        # Values of a dictionary encoded column for the given rows
+        codes, values = self.encoded[name]
+        selected = codes[rows]
+        if len(selected) == 0:
+            return np.empty(0, dtype=object)
+        if name not in self._lookups:
+            # Missing values (-1) pick the NaN appended to the values
+            self._lookups[name] = np.array(columnar.strings(values) + [np.nan], dtype=object)
+        return self._lookups[name][selected]
+
+    def category(self, name):
+        # (codes, values) of a column in category_columns
+        return self.categories[name]
+
+    def derived(self, name, compute):
+        # compute(self), computed once per dataset: a read-only array, or a tuple
+        # like (codes, values) whose arrays are made read-only
+        if name not in self._derived:
+            values = compute(self)
+            for array in (values if isinstance(values, tuple) else (values,)):
+                if isinstance(array, np.ndarray):
+                    array.setflags(write=False)
+            self._derived[name] = values
+        return self._derived[name]
+
+    def take(self, rows, names):
+        # Gather the given rows (positional indices) for a set of columns. Dictionary
+        # encoded columns not decoded yet are only decoded for these rows
+        return dict((name, self.columns[name][rows] if name in self.columns else self.decode(name, rows)) for name in names)
+
+
+def signature(path):
+    # Changes when the file is replaced or rewritten (the ETL replaces it atomically)
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def source(path):
+    # File to load for `path`: its compact copy (columnar.path_for) if that is at
+    # least as new as path, else path itself
+    compact = columnar.path_for(path)
+    if os.path.exists(compact) and (not os.path.exists(path) or os.path.getmtime(compact) >= os.path.getmtime(path)):
+        return compact
+    return path
+
+
+def read(path=None):
+    path = path or settings.input_path
+    filename = source(path)
+    current = signature(filename)
+    description = manifest.matching(filename, current)
+    if columnar.is_columnar(filename):
+        return Dataset(columnar.read(filename), path=path, signature=current, manifest=description)
+    return Dataset(pandas.read_csv(filename, sep='\t'), path=path, signature=current, manifest=description)
+
+
+def load(path=None):
+    # (Re)load the dataset for this process. Called from server_lifecycle.on_server_loaded
+    dataset = read(path)
+    swap(dataset)
+    return dataset
+
+
+def changed():
+    # True if the file on disk is not the one the current dataset was read from
+    with _lock:
+        current = _current
+    if current is None or current.signature is None:
+        return False
+    try:
+        return signature(source(current.path)) != current.signature
+    except OSError:
+        # Missing while being replaced, check again later
+        return False
+
+
+def swap(dataset):
+    # Make `dataset` the current one and tell every subscribed session. Sessions
+    # keep using the dataset they have until their callback runs.
+    global _current
+    with _lock:
+        _current = dataset
+        listeners = list(_listeners.items())
+    for doc, callback in listeners:
+        try:
+            doc.add_next_tick_callback(callback)
+        except RuntimeError:
+            # Document already destroyed
+            unsubscribe(doc)
+
+
+def subscribe(doc, callback):
+    # Run callback on the session's event loop whenever a new dataset is swapped in
+    with _lock:
+        _listeners[doc] = callback
+
+
+def unsubscribe(doc):
+    with _lock:
+        _listeners.pop(doc, None)
+
+
+def get():
+    # Dataset shared by all sessions. Loads on first use when running without
+    # server_lifecycle.py (e.g. "bokeh serve main.py")
+    global _current
+    with _lock:
+        if _current is None:
+            _current = read()
+        return _current
+
+
+def current():
+    # The current dataset without loading one, None before the first load
+    with _lock:
+        return _current
+
+
+def text(path):
+    # Contents of a small text file (the app's HTML descriptions), read again only once it changed
+    mtime = os.stat(path).st_mtime_ns
+    cached = _texts.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as handle:
+            cached = _texts[path] = (mtime, handle.read())
+    return cached[1]
+
+
+def reset():
+    global _current
+    with _lock:
+        _current = None
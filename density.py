@@ -0,0 +1,76 @@
+import numpy as np
+
+# Level of detail for large selections. Above settings.density_threshold points
+# in view, the selection is binned into a 2D density grid on the server and
+# drawn as one RGBA image instead of one glyph per row.
+
+# Color channel per database (RGB); rows from any other database are grey
+channels = [
+    ('MarRef', (0, 0, 255)),
+    ('MarDB', (0, 128, 0)),
+]
+other = (128, 128, 128)
+
+# Data for an image_rgba glyph that draws nothing
+empty = dict(image=[], x=[], y=[], dw=[], dh=[])
+
+
+def channel_codes(DB):
+    # Channel index per row, len(channels) for other databases
+    codes = np.full(len(DB), len(channels), dtype=np.uint8)
+    for code, (name, color) in enumerate(channels):
+        codes[DB == name] = code
+    return codes
+
+
+def extent(values, current):
+    # Binning range: the data extent, narrowed to the plot's current range if the browser reported one
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return 0.0, 1.0
+    start, end = float(finite.min()), float(finite.max())
+    if start == end:
+        return start - 0.5, end + 0.5
+    if current[0] is not None and current[1] is not None and np.isfinite(current).all():
+        low, high = max(start, min(current)), min(end, max(current))
+        if low < high:
+            return low, high
+    return start, end
+
+
+def in_view(x, y, x_extent, y_extent):
+    return (x >= x_extent[0]) & (x <= x_extent[1]) & (y >= y_extent[0]) & (y <= y_extent[1])
+
+
+def rasterize(x, y, codes, x_extent, y_extent, shape):
+    # RGBA image (uint32, rows = y bins) of the points inside the extents.
+    # Color is the count weighted mix of the database channels, opacity grows with log(count)
+    height, width = shape
+    inside = in_view(x, y, x_extent, y_extent)
+    ix = ((x[inside] - x_extent[0]) / (x_extent[1] - x_extent[0]) * width).astype(np.intp)
+    iy = ((y[inside] - y_extent[0]) / (y_extent[1] - y_extent[0]) * height).astype(np.intp)
+    np.clip(ix, 0, width - 1, out=ix)
+    np.clip(iy, 0, height - 1, out=iy)
+    cells = height * width
+    counts = np.bincount(codes[inside].astype(np.intp) * cells + iy * width + ix, minlength=(len(channels) + 1) * cells)
+    counts = counts.reshape(len(channels) + 1, cells).astype(float)
+    total = counts.sum(axis=0)
+
+    palette = np.array([color for name, color in channels] + [other], dtype=float)
+    rgba = np.zeros((cells, 4), dtype=np.uint8)
+    filled = total > 0
+    rgba[filled, :3] = (counts[:, filled].T.dot(palette) / total[filled, None]).astype(np.uint8)
+    if filled.any():
+        rgba[filled, 3] = (64 + 191 * np.log1p(total[filled]) / np.log1p(total.max())).astype(np.uint8)
+    return rgba.view(np.uint32).reshape(height, width)
+
+
+def image_data(x, y, codes, x_extent, y_extent, shape):
+    # Data for the image_rgba glyph covering the extents
+    return dict(
+        image=[rasterize(x, y, codes, x_extent, y_extent, shape)],
+        x=[x_extent[0]],
+        y=[y_extent[0]],
+        dw=[x_extent[1] - x_extent[0]],
+        dh=[y_extent[1] - y_extent[0]]
+    )
@@ -0,0 +1,62 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os.path import exists, join
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+# Conditional, concurrent downloads of the metadata files used by
+# update_and_deploy_input_data.py. Every file is cached as <cache_dir>/<name>.tsv
+# together with the ETag/Last-Modified of the response (<name>.json), which are
+# sent back as If-None-Match/If-Modified-Since on the next run.
+
+timeout = 300
+chunk_size = 1 << 20
+
+
+def cached(cache_dir, name):
+    return join(cache_dir, name + '.tsv'), join(cache_dir, name + '.json')
+
+
+def fetch(name, url, cache_dir):
+    # Returns (path to the local copy, True if it was (re)downloaded)
+    path, validators_path = cached(cache_dir, name)
+    headers = {}
+    if exists(path) and exists(validators_path):
+        with open(validators_path) as handle:
+            validators = json.load(handle)
+        if validators.get('url') != url:
+            validators = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as error:
+        if error.code == 304:
+            return path, False
+        raise
+    with response:
+        # Write next to the cached copy and rename, a failed download never replaces a good file
+        with open(path + '.part', 'wb') as handle:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                handle.write(chunk)
+        validators = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+    os.replace(path + '.part', path)
+    with open(validators_path, 'w') as handle:
+        json.dump(validators, handle)
+    return path, True
+
+
+def fetch_all(urls, cache_dir):
+    # Fetch every {name: url} concurrently. Returns {name: (path, changed)}
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    with ThreadPoolExecutor(max_workers=max(1, len(urls))) as executor:
+        futures = dict((name, executor.submit(fetch, name, url, cache_dir)) for name, url in urls.items())
+        return dict((name, future.result()) for name, future in futures.items())
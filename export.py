@@ -0,0 +1,153 @@
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+import pandas
+
+import datastore
+import filterindex
+
+# Rows matching the explorer's filters, as CSV or NDJSON. The parameters are
+# those of the widgets (bounds are inclusive, like the sliders) and the rows are
+# selected with the same filterindex.Selection the sessions use (the same
+# query with the sqlite backend), so rows missing a range column never match,
+# as in the explorer. Output is produced in chunks by a generator, so memory
+# stays bounded whatever the size of the result. Served as /export by serve.py, e.g.
+#
+#   /export?format=ndjson&database=MarDB&analysis_type=Metagenome+assembled+genome+(MAG)&qs_min=80&contigs_max=99
+#   /export?search=vibrio
+#
+# or from the command line, on input.tsv/input.col:
+#
+#   python mmp_interactive/export.py --database MarDB --qs-min 80 --contigs-max 99 --format ndjson
+
+# Parameter -> (FilterState field, index in the range); categorical parameters
+# take a widget value or "All"
+range_parameters = [
+    ('qs_min', ('qs', 0)),
+    ('qs_max', ('qs', 1)),
+    ('contigs_min', ('contigs', 0)),
+    ('contigs_max', ('contigs', 1)),
+    ('length_min', ('length', 0)),
+    ('length_max', ('length', 1)),
+]
+
+formats = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# Parameters of /export: the filters, search, format and columns
+parameters = [field for field, category in filterindex.category_filters] + [parameter for parameter, target in range_parameters] + ['search', 'format', 'columns']
+
+# Rows formatted per chunk
+chunk_rows = 10000
+
+
+def columns(dataset):
+    # Exported columns by default: every column but the index pandas wrote
+    return [name for name in dataset.names if not str(name).startswith('Unnamed: ')]
+
+
+def filter_state(parameters):
+    # FilterState from {parameter: value}. Missing ranges span all values, like
+    # the initial slider positions; raises ValueError on invalid parameters
+    values = {}
+    for field, (column, options) in filterindex.category_filters:
+        value = parameters.get(field) or 'All'
+        if value != 'All' and value not in options:
+            raise ValueError("%s must be one of %s" % (field, ', '.join(['All'] + options)))
+        values[field] = value
+    bounds = dict((field, [-np.inf, np.inf]) for field, column in filterindex.range_filters)
+    for parameter, (field, end) in range_parameters:
+        if parameters.get(parameter) not in (None, ''):
+            try:
+                bounds[field][end] = float(parameters[parameter])
+            except ValueError:
+                raise ValueError("%s must be a number" % parameter)
+            if not math.isfinite(bounds[field][end]):
+                raise ValueError("%s must be a finite number" % parameter)
+    values.update((field, tuple(bound)) for field, bound in bounds.items())
+    return filterindex.FilterState(search=parameters.get('search') or '', **values)
+
+
+def select(dataset, state):
+    return filterindex.Selection(dataset.index).select(state)
+
+
+def json_values(values):
+    # Python values of a column: floats keep every digit (shortest repr that
+    # reads back the same), missing and infinite values are None (null)
+    return [None if isinstance(value, float) and not math.isfinite(value) else value for value in values.tolist()]
+
+
+def frames(dataset, rows, names):
+    # DataFrames of the given rows, chunk_rows rows each
+    for start in range(0, len(rows), chunk_rows):
+        yield pandas.DataFrame(dataset.take(rows[start:start + chunk_rows], names), columns=names)
+
+
+def query_frames(store, state, names):
+    # The same from a sqlstore.Store (settings.backend 'sqlite'): one query per
+    # chunk, continuing after the last row number returned, so no database
+    # connection is held while the client reads a chunk
+    after = None
+    while True:
+        selected = store.select(state, names, after=after, limit=chunk_rows)
+        if len(selected):
+            yield pandas.DataFrame(selected.columns, columns=names)
+        if len(selected) < chunk_rows:
+            return
+        after = selected.rows[-1]
+
+
+def chunks(frames, names, format='csv'):
+    # Generator of text chunks, one per DataFrame of `frames`; CSV starts with a header
+    if format not in formats:
+        raise ValueError("format must be one of %s" % ', '.join(sorted(formats)))
+    if format == 'csv':
+        yield pandas.DataFrame(columns=names).to_csv(index=False)
+    for frame in frames:
+        if format == 'csv':
+            yield frame.to_csv(index=False, header=False)
+        else:
+            # One JSON object per line
+            columns = [json_values(frame[name]) for name in names]
+            yield ''.join(json.dumps(dict(zip(names, row))) + '\n' for row in zip(*columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the rows matching the explorer's filters")
+    parser.add_argument('--input', help="input.tsv (or its input.col), default settings.input_path")
+    parser.add_argument('--format', choices=sorted(formats), default='csv')
+    parser.add_argument('--columns', help="comma separated columns, default all")
+    parser.add_argument('--output', help="file to write, default standard output")
+    for field, (column, options) in filterindex.category_filters:
+        parser.add_argument('--' + field.replace('_', '-'), dest=field, default='All', help=', '.join(options))
+    for parameter, (field, end) in range_parameters:
+        parser.add_argument('--' + parameter.replace('_', '-'), dest=parameter, type=float)
+    parser.add_argument('--search', default='', help="scientific name or MMP ID, like the search box")
+    args = parser.parse_args()
+
+    dataset = datastore.read(args.input)
+    try:
+        state = filter_state(vars(args))
+    except ValueError as error:
+        parser.error(str(error))
+    names = args.columns.split(',') if args.columns else columns(dataset)
+    unknown = [name for name in names if name not in dataset.names]
+    if unknown:
+        parser.error("unknown columns: %s" % ', '.join(unknown))
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for chunk in chunks(frames(dataset, select(dataset, state), names), names, args.format):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
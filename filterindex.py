@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import search
+
+# Filter index built once per dataset at load time. Range filters (QS, contigs,
+# Assembly_length) are answered with a binary search in a sorted permutation of
+# the column, categorical filters by comparing the column's integer codes.
+# Compact dataset files carry the sorted permutations, which are then used
+# straight from the memory-mapped file (shared by every server process).
+
+# Normalized widget state. Ranges are (minimum, maximum) tuples, search is the
+# text of the search box ('' matches every row, see search.py)
+FilterState = namedtuple('FilterState', ['database', 'analysis_type', 'draft', 'qs', 'contigs', 'length', 'search'], defaults=[''])
+
+# Range filters: state field -> column
+range_filters = [
+    ('qs', 'QS'),
+    ('contigs', 'contigs'),
+    ('length', 'Assembly_length'),
+]
+
+# Categorical filters: state field -> (column, widget values). A widget value
+# matches the rows whose column value is exactly equal to it
+category_filters = [
+    ('database', ('DB', ['MarRef', 'MarDB'])),
+    ('analysis_type', ('analysis_project_type', ['Whole genome sequencing (WGS)', 'Metagenome assembled genome (MAG)', 'Single amplified genome (SAG)'])),
+    ('draft', ('quality', ['Finished', 'High Quality Draft', 'Near Complete', 'Medium Quality Draft', 'Low Quality Draft', 'Very Low Quality Draft'])),
+]
+
+
+def range_arrays(values):
+    # (order, sorted, valid) of a RangeIndex over values (floats). Computed at
+    # load time, or read from a compact dataset file (columnar.write() stores them)
+    # argsort puts NaN last; rows with missing values never match a range
+    order = np.argsort(values, kind='stable')
+    order = order[:int(np.count_nonzero(~np.isnan(values)))]
+    order = order.astype(np.int32 if len(values) < 2 ** 31 else np.int64)
+    valid = np.zeros(len(values), dtype=bool)
+    valid[order] = True
+    return order, values[order], valid
+
+
+class RangeIndex(object):
+
+    def __init__(self, order, sorted, valid):
+        # Rows with a value in ascending value order, their values, and a mask of those rows
+        self.size = len(valid)
+        self.order = order
+        self.sorted = sorted
+        self.valid = valid
+
+    def mask(self, low, high):
+        # Rows with low <= value <= high
+        lo = np.searchsorted(self.sorted, low, side='left')
+        hi = max(lo, np.searchsorted(self.sorted, high, side='right'))
+        if hi - lo < len(self.order) // 2:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[self.order[lo:hi]] = True
+        else:
+            # Wide range, clear the rows outside it instead
+            mask = self.valid.copy()
+            mask[self.order[:lo]] = False
+            mask[self.order[hi:]] = False
+        return mask
+
+
+class FilterIndex(object):
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.size = len(dataset)
+        self.ranges = {}
+        for field, column in range_filters:
+            arrays = dataset.range_indexes.get(column)
+            if arrays is None:
+                arrays = range_arrays(np.asarray(dataset.column(column), dtype=float))
+            self.ranges[field] = RangeIndex(*arrays)
+        self.categories = {}
+        for field, (column, values) in category_filters:
+            self.categories[field] = dataset.category(column)
+
+    def range_mask(self, field, bounds):
+        return self.ranges[field].mask(*bounds)
+
+    def category_mask(self, field, value):
+        # No mask (every row matches) for "All"
+        if value == "All":
+            return None
+        codes, values = self.categories[field]
+        if value not in values:
+            return np.zeros(self.size, dtype=bool)
+        return codes == values.index(value)
+
+    def search_mask(self, query):
+        return search.index(self.dataset).mask(query)
+
+
+class Selection(object):
+    # Per-session filter. Keeps the mask of every widget and only recomputes
+    # the ones whose value changed since the previous call.
+
+    def __init__(self, index):
+        self.index = index
+        self.keys = {}
+        self.masks = {}
+        self.state = None
+        self.rows = None
+
+    def _mask(self, field, key, compute):
+        if self.keys.get(field) != key:
+            self.keys[field] = key
+            self.masks[field] = compute()
+        return self.masks[field]
+
+    def select(self, state):
+        if state == self.state:
+            return self.rows
+        mask = np.ones(self.index.size, dtype=bool)
+        for field, column in range_filters:
+            bounds = getattr(state, field)
+            mask &= self._mask(field, bounds, lambda: self.index.range_mask(field, bounds))
+        for field, category in category_filters:
+            value = getattr(state, field)
+            category_mask = self._mask(field, value, lambda: self.index.category_mask(field, value))
+            if category_mask is not None:
+                mask &= category_mask
+        if search.normalize(state.search):
+            mask &= self._mask('search', state.search, lambda: self.index.search_mask(state.search))
+        self.state = state
+        self.rows = np.flatnonzero(mask)
+        return self.rows
+
+
+class ResultCache(object):
+    # Least recently used cache of filter results, shared by the sessions of a
+    # dataset. Values are tuples of read-only arrays and numbers; the cache holds
+    # at most `limit` bytes of arrays (plus a small cost per entry). Worker
+    # threads use it too (sqlstore.Store.summarize)
+
+    entry_bytes = 256
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def cost(cls, value):
+        return cls.entry_bytes + sum(item.nbytes for item in value if isinstance(item, np.ndarray))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get(self, key):
+        # Cached value or None
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.cost(value)
+        if size > self.limit:
+            return value
+        for item in value:
+            if isinstance(item, np.ndarray):
+                item.setflags(write=False)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.cost(self.entries.pop(key))
+            self.entries[key] = value
+            self.size += size
+            while self.size > self.limit:
+                key, evicted = self.entries.popitem(last=False)
+                self.size -= self.cost(evicted)
+        return value
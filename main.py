@@ -1,24 +1,32 @@
-import os
+from functools import partial
 from os.path import dirname, join
 
 import numpy as np
-import pandas.io.sql as psql
-import pandas
-import sqlite3 as sql
-from collections import Counter
 
 from bokeh.plotting import figure
-from bokeh.layouts import layout, column
-from bokeh.models import ColumnDataSource, Div, OpenURL, TapTool, NumeralTickFormatter
+from bokeh.layouts import layout, column, row
+from bokeh.models import ColumnDataSource, CDSView, CustomJS, IndexFilter, Div, OpenURL, TapTool, NumeralTickFormatter, HoverTool, Legend, LinearColorMapper
 from bokeh.models.widgets import Slider, Select, TextInput
 from bokeh.io import curdoc
-from bokeh.palettes import Oranges, Greens, Blues, Purples
 
-# Paths to data
-parsed_path = join(os.getcwd(), 'mmp_interactive/inputdata/input.tsv')
+import clientfilter
+import datastore
+import density
+import filterindex
+import metrics
+import rowdetails
+import settings
+import sqlstore
+import summary
+from scheduler import UpdateScheduler
 
-# Parse data
-parsed = pandas.read_csv(parsed_path, sep='\t')
+# With the sqlite backend every update queries input.sqlite (sqlstore.py) and
+# the dataset is not loaded; only the 'data' filter mode reads rows per update
+# (checked by server_lifecycle.on_server_loaded)
+use_sqlite = settings.backend == 'sqlite'
+
+# Dataset is parsed once per server process (see server_lifecycle.py) and shared by all sessions
+parsed = sqlstore.get() if use_sqlite else datastore.get()
 total = len(parsed)
 
 axis_map = {
@@ -54,24 +62,98 @@ axis_map = {
 }
 
 
-desc = Div(text=open(join(dirname(__file__), "description.html")).read(), sizing_mode="stretch_width")
-qual_desc = Div(text=open(join(dirname(__file__), "quality_explaination.html")).read(), sizing_mode="stretch_width")
+desc = Div(text=datastore.text(join(dirname(__file__), "description.html")), sizing_mode="stretch_width")
+qual_desc = Div(text=datastore.text(join(dirname(__file__), "quality_explaination.html")), sizing_mode="stretch_width")
 
 # Create Input controls
-database = Select(title="Database", value="All", options=['All', 'MarRef', 'MarDB'])
-analysis_type = Select(title="Type", value="All", options=['All', 'Whole genome sequencing (WGS)', 'Metagenome assembled genome (MAG)', 'Single amplified genome (SAG)'])
-draft = Select(title="Draft Quality *", value="All", options=['All', 'Finished', 'High Quality Draft', 'Near Complete', 'Medium Quality Draft', 'Low Quality Draft', 'Very Low Quality Draft'])
-minqsscore = Slider(title="Minimum QS score", value=min(parsed['QS']), start=min(parsed['QS']), end=max(parsed['QS']), step=5)
-maxqsscore = Slider(title="Maximum QS score", value=max(parsed['QS']), start=-50, end=max(parsed['QS']), step=5)
+category_options = dict((field, ['All'] + values) for field, (column, values) in filterindex.category_filters)
+database = Select(title="Database", value="All", options=category_options['database'])
+analysis_type = Select(title="Type", value="All", options=category_options['analysis_type'])
+draft = Select(title="Draft Quality *", value="All", options=category_options['draft'])
+min_qs, max_qs = parsed.bounds['QS']
+max_length = parsed.bounds['Assembly_length'][1]
+max_contigs = parsed.bounds['contigs'][1]
+minqsscore = Slider(title="Minimum QS score", value=min_qs, start=min_qs, end=max_qs, step=5)
+maxqsscore = Slider(title="Maximum QS score", value=max_qs, start=-50, end=max_qs, step=5)
 minlength = Slider(title="Minimum Genome Length", value=1, start=1, end=15000000, step=100000)
-maxlength = Slider(title="Maximum Genome Length", value=max(parsed['Assembly_length']), start=0, end=max(parsed['Assembly_length']), step=500000)
+maxlength = Slider(title="Maximum Genome Length", value=max_length, start=0, end=max_length, step=500000)
 mincontigs = Slider(title="Minimum Number of Contigs", value=1, start=1, end=2000, step=5)
-maxcontigs = Slider(title="Maximum Number of Contigs", value=max(parsed['contigs']), start=1, end=max(parsed['contigs']), step=50)
+maxcontigs = Slider(title="Maximum Number of Contigs", value=max_contigs, start=1, end=max_contigs, step=50)
+# Filters by scientific name or MMP ID on every keystroke (value_input), see search.py
+search = TextInput(title="Search name or MMP ID", placeholder="e.g. Vibrio or MMP00001234")
 x_axis = Select(title="X Axis", options=sorted(axis_map.keys()), value="Genome Length")
 y_axis = Select(title="Y Axis", options=sorted(axis_map.keys()), value="CheckM Completeness")
 
+
+def source_data(rows, x_name, y_name):
+    # Columns of the plot's data source for the given rows
+    if settings.lazy_tooltips:
+        # Tooltip fields are fetched per hovered row (rowdetails.py)
+        return dict(
+            x=parsed.column(x_name)[rows],
+            y=parsed.column(y_name)[rows],
+            row=np.arange(total, dtype=np.int32)[rows] if isinstance(rows, slice) else np.asarray(rows, dtype=np.int32),
+            group=rowdetails.style_groups(parsed)[0][rows]
+        )
+    names = source_columns(x_name, y_name)
+    columns = parsed.take(rows, set(names.values()))
+    return dict((field, columns[name]) for field, name in names.items())
+
+
+def source_columns(x_name, y_name):
+    # Data source column -> dataset column
+    return dict(
+        x=x_name,
+        y=y_name,
+        color="color",
+        db="db",
+        mmpid="mmp_ID",
+        fsn="full_scientific_name",
+        apt="analysis_project_type",
+        alpha="alpha",
+        label='label',
+        qual='quality',
+        comp='Completeness',
+        cont='Contamination'
+    )
+
+
+def show_columns(names, columns):
+    # Sqlite backend: data source of the drawn rows, from the columns read by sqlstore.Store.take()
+    source.data = dict((field, columns[name]) for field, name in names.items())
+
+
+def slider_bounds(dataset):
+    # (slider, start, end) for the sliders whose range follows the data
+    min_qs, max_qs = dataset.bounds['QS']
+    max_length = dataset.bounds['Assembly_length'][1]
+    max_contigs = dataset.bounds['contigs'][1]
+    return [
+        (minqsscore, min_qs, max_qs),
+        (maxqsscore, -50, max_qs),
+        (maxlength, 0, max_length),
+        (maxcontigs, 1, max_contigs),
+    ]
+
 # Create Column Data Source that will be used by the plot
-source = ColumnDataSource(data=dict(x=[], y=[], color=[], db=[], mmpid=[], apt=[], fsn=[], alpha=[], label=[], qual=[], comp=[], cont=[]))
+if settings.filter_mode == 'view':
+    # Every row is sent to the client once; updates only replace the index filter of the view
+    plotted = dict(x=axis_map[x_axis.value], y=axis_map[y_axis.value])
+    source = ColumnDataSource(data=source_data(slice(None), plotted['x'], plotted['y']))
+    view = CDSView(source=source, filters=[IndexFilter(indices=[])])
+elif settings.filter_mode == 'client':
+    # Every row and the filter columns are sent to the client once; the browser does the filtering
+    plotted = dict(x=axis_map[x_axis.value], y=axis_map[y_axis.value])
+    source = ColumnDataSource(data=dict(source_data(slice(None), plotted['x'], plotted['y']), **clientfilter.filter_columns(parsed)))
+    view = CDSView(source=source)
+elif settings.lazy_tooltips:
+    source = ColumnDataSource(data=source_data(slice(0, 0), axis_map[x_axis.value], axis_map[y_axis.value]))
+    view = CDSView(source=source)
+else:
+    source = ColumnDataSource(data=dict(x=[], y=[], color=[], db=[], mmpid=[], apt=[], fsn=[], alpha=[], label=[], qual=[], comp=[], cont=[]))
+    view = CDSView(source=source)
+# Version of the dataset the row numbers refer to, for the /rows lookups of lazy tooltips
+source.tags = [str(parsed.version)]
 
 TOOLTIPS=[
     ("Database", "@db"),
@@ -82,101 +164,295 @@ TOOLTIPS=[
     ("Completeness", "@comp"),
     ("Contamination", "@cont")
 ]
+if settings.lazy_tooltips:
+    TOOLTIPS = rowdetails.tooltips(TOOLTIPS)
 
-p = figure(plot_height=800, plot_width=1500, title="", toolbar_location=None, tooltips=TOOLTIPS, sizing_mode="fixed", tools="tap")
-p.circle(x="x", y="y", source=source, size=7, color="color", line_color=None, fill_alpha="alpha", legend='label')
+# Large selections are drawn as a density image, zooming in switches back to points
+use_density = settings.density_threshold > 0 and settings.filter_mode != 'client'
+density_source = ColumnDataSource(data=density.empty)
+shown = dict(density=False, x=None, y=None)
 
+if use_density:
+    p = figure(plot_height=800, plot_width=1500, title="", toolbar_location="right", tooltips=TOOLTIPS, sizing_mode="fixed", tools="tap,pan,wheel_zoom,reset", active_scroll="wheel_zoom")
+    p.image_rgba(image="image", x="x", y="y", dw="dw", dh="dh", source=density_source)
+else:
+    p = figure(plot_height=800, plot_width=1500, title="", toolbar_location=None, tooltips=TOOLTIPS, sizing_mode="fixed", tools="tap")
+if settings.lazy_tooltips:
+    # Color and alpha come from the style group code, the legend is kept up to date by update()
+    groups = rowdetails.style_groups(parsed)[1]
+    group_colors = LinearColorMapper(palette=rowdetails.palette(groups), low=-0.5, high=len(groups) - 0.5)
+    points = p.circle(x="x", y="y", source=source, view=view, size=7, color=dict(field="group", transform=group_colors), line_color=None)
+    legend = Legend(items=rowdetails.legend_items(parsed, points))
+    p.add_layout(legend)
+    hover = p.select_one(HoverTool)
+    hover.formatters = {'@row': rowdetails.hover_formatter(source)}
+    hover.callback = rowdetails.prefetch_callback(source)
+else:
+    p.circle(x="x", y="y", source=source, view=view, size=7, color="color", line_color=None, fill_alpha="alpha", legend='label')
 
-def select_entries():
-    # Get widget values
-    db_val = database.value
-    type_val = analysis_type.value
-    qual_val = draft.value
+# 10, 1k, 124m formatting for numbers on x/y axes
+p.xaxis.formatter=NumeralTickFormatter(format="0a")
+p.yaxis.formatter=NumeralTickFormatter(format="0a")
+# Text fontsize on axes
+p.xaxis.axis_label_text_font_size = "14pt"
+p.yaxis.axis_label_text_font_size = "14pt"
+# Number (major ticks) fontsize on axes
+p.xaxis.major_label_text_font_size = "10pt"
+p.yaxis.major_label_text_font_size = "10pt"
+
+# Marginal histograms of the drawn rows, sharing the scatter plot's ranges. Not
+# shown in 'client' filter mode, where the server does not see the selection
+use_marginals = settings.filter_mode != 'client'
+if use_marginals:
+    # Auto ranging follows the scatter plot only, not the histogram bins
+    p.x_range.renderers = list(p.renderers)
+    p.y_range.renderers = list(p.renderers)
+    x_histogram = ColumnDataSource(data=dict(start=[], end=[], count=[]))
+    y_histogram = ColumnDataSource(data=dict(start=[], end=[], count=[]))
+    x_marginal = figure(plot_height=150, plot_width=1500, x_range=p.x_range, toolbar_location=None, tools="", sizing_mode="fixed")
+    x_marginal.quad(left="start", right="end", bottom=0, top="count", source=x_histogram, color="grey", line_color="white")
+    y_marginal = figure(plot_height=800, plot_width=200, y_range=p.y_range, toolbar_location=None, tools="", sizing_mode="fixed")
+    y_marginal.quad(left=0, right="count", bottom="start", top="end", source=y_histogram, color="grey", line_color="white")
+    for marginal in (x_marginal, y_marginal):
+        marginal.xaxis.formatter = NumeralTickFormatter(format="0a")
+        marginal.yaxis.formatter = NumeralTickFormatter(format="0a")
+    stats = Div(text="", sizing_mode="stretch_width")
+    # Same left border, so the histogram lines up with the scatter plot's frame
+    p.min_border_left = x_marginal.min_border_left = 80
+
+# Taptool specifics, links etc.
+url = "https://mmp.sfb.uit.no/databases/@db/#/records/@mmpid"
+taptool = p.select(type=TapTool)
+if settings.lazy_tooltips:
+    taptool.callback = rowdetails.tap_callback(source, url)
+else:
+    taptool.callback = OpenURL(url=url)
+
+if settings.filter_mode == 'client':
+    view.filters = [clientfilter.make_filter(dict(
+        database=database,
+        analysis_type=analysis_type,
+        draft=draft,
+        qs_min=minqsscore,
+        qs_max=maxqsscore,
+        contigs_min=mincontigs,
+        contigs_max=maxcontigs,
+        length_min=minlength,
+        length_max=maxlength,
+        search=search
+    ), p.title)]
+
+
+# Filter masks of this session, reused for widgets that did not change
+selection = None if use_sqlite else filterindex.Selection(parsed.index)
+
+
+def filter_state():
+    return filterindex.FilterState(
+        database=database.value,
+        analysis_type=analysis_type.value,
+        draft=draft.value,
+        qs=(minqsscore.value, maxqsscore.value),
+        contigs=(mincontigs.value, maxcontigs.value),
+        length=(minlength.value, maxlength.value),
+        search=search.value_input
+    )
+
+
+@metrics.timed(metrics.filter_seconds)
+def select_entries(state):
+    # Positional indices of the rows matching the widget values
+    return selection.select(state)
 
-    # Filter dataset based on widget values
-    selected = parsed[
-        (parsed.QS >= minqsscore.value) &
-        (parsed.QS <= maxqsscore.value) &
-        (parsed.contigs >= mincontigs.value) &
-        (parsed.contigs <= maxcontigs.value) &
-        (parsed.Assembly_length >= minlength.value) &
-        (parsed.Assembly_length <= maxlength.value)
-    ]
-    
-    # Filter based on categories
-    if (qual_val != "All"):
-        selected = selected[selected.quality.str.contains(qual_val)==True]
-
-    if (db_val != "All"):
-        selected = selected[selected.DB.str.contains(db_val)==True]
-    if (type_val != "All"):
-        if (type_val == "Whole genome sequencing (WGS)"):
-            selected = selected[selected.analysis_project_type.str.contains("WGS")==True]
-        if (type_val == "Metagenome assembled genome (MAG)"):
-            selected = selected[selected.analysis_project_type.str.contains("MAG")==True]
-        if (type_val == "Single amplified genome (SAG)"):
-            selected = selected[selected.analysis_project_type.str.contains("SAG")==True]
-    return selected
 
+def filter_results(x_name, y_name):
+    # (selected rows, summary.Summary), from the cache of the dataset when any
+    # session of this process already asked for the same widget state
+    key = (filter_state(), x_name, y_name)
+    results = parsed.results.get(key)
+    metrics.filter_cache.inc(1, 'miss' if results is None else 'hit')
+    if results is None:
+        rows = select_entries(key[0])
+        with metrics.stats_seconds.time():
+            statistics = summary.summarize(parsed, rows, x_name, y_name)
+        results = parsed.results.put(key, (rows, statistics))
+    return results
 
+
+def histogram_edges(name):
+    return parsed.edges(name) if use_sqlite else summary.binned(parsed, name)[1]
+
+
+def update_legend(rows, positions):
+    # Lazy tooltips: show the legend entries of the style groups among the drawn rows
+    first = rowdetails.first_positions(parsed, rows, positions)
+    for code, item in enumerate(legend.items):
+        if code not in first:
+            if item.visible:
+                item.visible = False
+        elif not item.visible or item.index != first[code]:
+            item.update(visible=True, index=first[code])
+
+
+@metrics.timed(metrics.update_seconds)
 def update():
-    df = select_entries()
     x_name = axis_map[x_axis.value]
     y_name = axis_map[y_axis.value]
 
-    # Calculate selection statistics
-    missing=0
-    for pos, values in enumerate(zip(df[x_name], df[y_name]),0):
-       if np.isnan(values[0]) or np.isnan(values[1]):
-               missing+=1
-
     # Axes text from widgets
     p.xaxis.axis_label = x_axis.value
     p.yaxis.axis_label = y_axis.value
-    # 10, 1k, 124m formatting for numbers on x/y axes
-    p.xaxis.formatter=NumeralTickFormatter(format="0a")
-    p.yaxis.formatter=NumeralTickFormatter(format="0a")
-    # Text fontsize on axes
-    p.xaxis.axis_label_text_font_size = "14pt"
-    p.yaxis.axis_label_text_font_size = "14pt"
-    # Number (major ticks) fontsize on axes
-    p.xaxis.major_label_text_font_size = "10pt"
-    p.yaxis.major_label_text_font_size = "10pt"
+
+    if settings.filter_mode in ('view', 'client'):
+        # Only the numeric columns of a changed axis are resent
+        if plotted['x'] != x_name:
+            source.data['x'] = parsed.column(x_name)
+            plotted['x'] = x_name
+        if plotted['y'] != y_name:
+            source.data['y'] = parsed.column(y_name)
+            plotted['y'] = y_name
+    if settings.filter_mode == 'client':
+        # Selection and title are computed by the CustomJSFilter in the browser
+        if settings.lazy_tooltips:
+            update_legend(slice(None), np.arange(total))
+        return
+
+    if use_sqlite:
+        # Results are cached per store like filter_results(); the query only runs,
+        # in a worker thread, when no session asked for this state yet
+        key = (filter_state(), x_name, y_name)
+        results = parsed.results.get(key)
+        metrics.filter_cache.inc(1, 'miss' if results is None else 'hit')
+        if results is None:
+            scheduler.background(partial(parsed.summarize, *key), partial(queried, x_name, y_name))
+        else:
+            draw(x_name, y_name, *results)
+    else:
+        rows, statistics = filter_results(x_name, y_name)
+        draw(x_name, y_name, rows, None, None, None, statistics)
+
+
+def queried(x_name, y_name, result):
+    # Draw what sqlstore.Store.summarize() returned
+    results, seconds = result
+    if seconds is not None:
+        metrics.filter_seconds.observe(seconds)
+    draw(x_name, y_name, *results)
+
+
+def draw(x_name, y_name, rows, x, y, codes, statistics):
+    # Show the rows selected for the given axes: positions in the dataset, or
+    # with the sqlite backend the row numbers a query returned and their X, Y
+    # and density.channel_codes() values
+    if use_sqlite:
+        numbers, rows = rows, np.arange(len(rows))
+    metrics.selected_rows.observe(len(rows))
+    missing = statistics.missing
+
     # Title
-    p.title.text = "%d entries shown" % len(df)
-    p.title.text = "Showing {} entries out of {}. ({} entries are filtered using widgets or have missing data for either X or Y)".format(total-((total-len(df))+missing), total, (total-len(df))+missing)
-    # Taptool specifics, links etc.
-    url = "https://mmp.sfb.uit.no/databases/@db/#/records/@mmpid"
-    taptool = p.select(type=TapTool)
-    taptool.callback = OpenURL(url=url)
+    p.title.text = "Showing {} entries out of {}. ({} entries are filtered using widgets or have missing data for either X or Y)".format(total-((total-len(rows))+missing), total, (total-len(rows))+missing)
+
+    # Statistics and marginal histograms of the drawn rows
+    x_histogram.data = summary.histogram_data(histogram_edges(x_name), statistics.x_counts)
+    y_histogram.data = summary.histogram_data(histogram_edges(y_name), statistics.y_counts)
+    stats.text = summary.html(statistics, x_axis.value, y_axis.value)
+
+    # Rows drawn as circles
+    drawn = rows
+    if use_density:
+        if not use_sqlite:
+            x = parsed.column(x_name)[rows]
+            y = parsed.column(y_name)[rows]
+        x_current = (p.x_range.start, p.x_range.end) if shown['x'] == x_name else (None, None)
+        y_current = (p.y_range.start, p.y_range.end) if shown['y'] == y_name else (None, None)
+        x_extent = density.extent(x, x_current)
+        y_extent = density.extent(y, y_current)
+        shown.update(x=x_name, y=y_name)
+        shown['density'] = np.count_nonzero(density.in_view(x, y, x_extent, y_extent)) > settings.density_threshold
+        if shown['density']:
+            if not use_sqlite:
+                codes = parsed.derived('density_channel', lambda dataset: density.channel_codes(dataset.take(slice(None), ['DB'])['DB']))[rows]
+            shape = (p.plot_height // settings.density_cell_pixels, p.plot_width // settings.density_cell_pixels)
+            with metrics.density_seconds.time():
+                density_source.data = density.image_data(x, y, codes, x_extent, y_extent, shape)
+            drawn = rows[:0]
+        else:
+            density_source.data = density.empty
+
+    if settings.filter_mode == 'view':
+        # Everything but an axis change is sent as an index set
+        view.filters = [IndexFilter(indices=drawn)]
+    elif use_sqlite:
+        # The tooltip columns of the drawn rows are read in a worker thread too
+        names = source_columns(x_name, y_name)
+        scheduler.background(partial(parsed.take, numbers[drawn], set(names.values())), partial(show_columns, names))
+    else:
+        source.data = source_data(drawn, x_name, y_name)
+    if settings.lazy_tooltips:
+        update_legend(drawn, drawn if settings.filter_mode == 'view' else np.arange(len(drawn)))
 
-    source.data = dict(
-        x=df[x_name],
-        y=df[y_name],
-        color=df["color"],
-        db=df["db"],
-        mmpid=df["mmp_ID"],
-        fsn=df["full_scientific_name"],
-        apt=df["analysis_project_type"],
-        alpha=df["alpha"],
-        label=df['label'],
-        qual=df['quality'],
-        comp=df['Completeness'],
-        cont=df['Contamination']
-    )
 
-controls = [database, analysis_type, draft, minqsscore, maxqsscore, minlength, maxlength, mincontigs, maxcontigs, x_axis, y_axis]
+def update_view(attr, old, new):
+    # Zooming or panning only matters while the density image is shown
+    if shown['density']:
+        scheduler.request(attr, old, new)
+
+# Bursts of widget changes (e.g. dragging a slider) are merged into one update()
+scheduler = UpdateScheduler(curdoc(), update)
+
+controls = [search, database, analysis_type, draft, minqsscore, maxqsscore, minlength, maxlength, mincontigs, maxcontigs, x_axis, y_axis]
 for control in controls:
-    control.on_change('value', lambda attr, old, new: update())
+    event = 'value_input' if control is search else settings.slider_event if isinstance(control, Slider) else 'value'
+    if settings.filter_mode == 'client' and control not in (x_axis, y_axis):
+        # Re-run the CustomJSFilter in the browser, the server is not involved
+        control.js_on_change(event, CustomJS(args=dict(source=source), code="source.change.emit()"))
+    else:
+        control.on_change(event, scheduler.request)
 controls.append(qual_desc)
+if use_density:
+    for plot_range in (p.x_range, p.y_range):
+        plot_range.on_change('start', update_view)
+        plot_range.on_change('end', update_view)
 
 inputs = column(*controls, width=320, height=1000)
 inputs.sizing_mode = "fixed"
+plots = column(x_marginal, row(p, y_marginal), stats) if use_marginals else p
 l = layout([
     [desc],
-    [inputs, p],
+    [inputs, plots],
 ], sizing_mode="scale_both", height=600, width=800)
 
+
+def reload_dataset():
+    # A refreshed dataset was swapped in (server_lifecycle.reload): move this session to it,
+    # follow the new slider ranges and re-run the current filter against the new rows
+    global parsed, total, selection
+    parsed = datastore.get()
+    total = len(parsed)
+    selection = filterindex.Selection(parsed.index)
+    for slider, start, end in slider_bounds(parsed):
+        # Handles left at either end stay at that end, others are clamped into the new range
+        if slider.value <= slider.start:
+            value = start
+        elif slider.value >= slider.end:
+            value = end
+        else:
+            value = min(max(slider.value, start), end)
+        slider.update(start=start, end=end, value=value)
+    source.tags = [str(parsed.version)]
+    if settings.lazy_tooltips:
+        groups = rowdetails.style_groups(parsed)[1]
+        group_colors.update(palette=rowdetails.palette(groups), high=len(groups) - 0.5)
+        legend.items = rowdetails.legend_items(parsed, points)
+    if settings.filter_mode == 'view':
+        source.data = source_data(slice(None), plotted['x'], plotted['y'])
+    elif settings.filter_mode == 'client':
+        source.data = dict(source_data(slice(None), plotted['x'], plotted['y']), **clientfilter.filter_columns(parsed))
+    scheduler.request('data', None, parsed.version)
+
+if not use_sqlite:
+    datastore.subscribe(curdoc(), reload_dataset)
+
 # initial load of the data
 update()  
 
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# Summary of a dataset file written next to it by the ETL (manifest.json): data
+# version, row count, statistics per column and slider ranges. The explorer only
+# reads the slider ranges: datastore.read() takes the slider bounds from it
+# instead of scanning the columns when it describes the file being loaded, i.e.
+# its size and mtime match. The widgets, including the options of the category
+# selects (filterindex.category_filters), are still built from the dataset
+# loaded by server_lifecycle.py; the rest describes the file for operators.
+#
+#   python mmp_interactive/manifest.py inputdata/input.tsv   (writes inputdata/manifest.json)
+
+format_version = 1
+name = 'manifest.json'
+
+
+def path_for(path):
+    return os.path.join(os.path.dirname(path), name)
+
+
+def matching(path, signature):
+    # Manifest for the dataset file `path` with the given datastore.signature(), or None
+    try:
+        with open(path_for(path)) as handle:
+            manifest = json.load(handle)
+    except (IOError, ValueError):
+        return None
+    if manifest.get('format') != format_version or manifest.get('file') != os.path.basename(signature[0]):
+        return None
+    if manifest.get('mtime_ns') != signature[1] or manifest.get('size') != signature[2]:
+        return None
+    return manifest
+
+
+def statistics(values):
+    if values.dtype.kind in 'biuf':
+        values = np.asarray(values, dtype=float)
+        finite = values[np.isfinite(values)]
+        return {
+            'type': 'number',
+            'missing': int(np.count_nonzero(np.isnan(values))),
+            'min': float(finite.min()) if len(finite) else None,
+            'max': float(finite.max()) if len(finite) else None,
+        }
+    missing = np.array([value != value for value in values], dtype=bool)
+    return {
+        'type': 'text',
+        'missing': int(np.count_nonzero(missing)),
+        'distinct': len(set(values[~missing])),
+    }
+
+
+def column_statistics(dataset, name):
+    # statistics() of a dataset column, from the codes of a dictionary encoded one
+    # (columnar.py) instead of decoding every value
+    if name in dataset.encoded:
+        codes = dataset.encoded[name][0]
+        present = codes[codes >= 0]
+        return {
+            'type': 'text',
+            'missing': int(len(codes) - len(present)),
+            'distinct': int(np.count_nonzero(np.bincount(present))),
+        }
+    return statistics(dataset.column(name))
+
+
+def write(path=None):
+    # Describe the file datastore.read(path) loads (input.col when up to date)
+    import datastore
+    dataset = datastore.read(path)
+    filename, mtime_ns, size, inode = dataset.signature
+    manifest = {
+        'format': format_version,
+        'file': os.path.basename(filename),
+        'mtime_ns': mtime_ns,
+        'size': size,
+        'version': dataset.version,
+        'rows': len(dataset),
+        'columns': dict((str(column), column_statistics(dataset, column)) for column in dataset.names),
+        'sliders': dict((column, list(bounds)) for column, bounds in dataset.bounds.items()),
+    }
+    target = path_for(filename)
+    with open(target + '.part', 'w') as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+    os.replace(target + '.part', target)
+    return target
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print("Wrote %s" % write(path))
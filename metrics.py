@@ -0,0 +1,244 @@
+import time
+from bisect import bisect_left
+
+import datastore
+import settings
+import sqlstore
+
+# Process-wide counters, gauges and histograms, exposed in the Prometheus text
+# format on /metrics by serve.py. Everything runs on the server's event loop
+# thread, so updates are plain attribute writes (no locking).
+#
+# With settings.metrics off, timed() returns the function unchanged, time()
+# returns a shared no-op context and observe()/inc() return immediately.
+
+registry = []
+
+# Upper bounds of the histogram buckets
+seconds_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+rows_buckets = [0, 10, 100, 1000, 10000, 100000, 1000000, 10000000]
+
+
+def label_text(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values))
+
+
+def number(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_timer = NullTimer()
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        registry.append(self)
+
+    def samples(self):
+        # [(suffix, label names, label values, value)]
+        raise NotImplementedError
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, names, values, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, label_text(names, values), number(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        Metric.__init__(self, name, help, labels)
+        self.values = {}
+
+    def inc(self, amount=1, *labels):
+        if not settings.metrics:
+            return
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        return [('', self.labels, labels, value) for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    # Either set() explicitly or read from `function` when rendered
+    kind = 'gauge'
+
+    def __init__(self, name, help, function=None):
+        Metric.__init__(self, name, help)
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [('', (), (), self.function() if self.function else self.value)]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=seconds_buckets):
+        Metric.__init__(self, name, help)
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        if not settings.metrics:
+            return
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        # with histogram.time(): ...
+        if not settings.metrics:
+            return null_timer
+        return Timer(self)
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            cumulative += count
+            samples.append(('_bucket', ('le',), (number(bound),), cumulative))
+        samples.append(('_sum', (), (), self.sum))
+        samples.append(('_count', (), (), self.count))
+        return samples
+
+
+class Timer(object):
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def timed(histogram):
+    # Decorator recording the run time of every call in `histogram`
+    def decorate(function):
+        if not settings.metrics:
+            return function
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        wrapper.__name__ = function.__name__
+        return wrapper
+    return decorate
+
+
+def render():
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+def current_data():
+    # The dataset this process serves, or the sqlstore.Store with the sqlite backend
+    return sqlstore.current() if settings.backend == 'sqlite' else datastore.current()
+
+
+def current_version():
+    dataset = current_data()
+    return dataset.version if dataset is not None else 0
+
+
+def current_rows():
+    dataset = current_data()
+    return len(dataset) if dataset is not None else 0
+
+
+def process_memory(name):
+    # Field of /proc/self/status in bytes (Linux), 0 elsewhere
+    def read():
+        try:
+            with open('/proc/self/status') as handle:
+                for line in handle:
+                    if line.startswith(name + ':'):
+                        return int(line.split()[1]) * 1024
+        except IOError:
+            pass
+        return 0
+    return read
+
+
+update_seconds = Histogram('mmp_update_seconds', "Time spent in update() per plot refresh")
+filter_seconds = Histogram('mmp_filter_seconds', "Time spent selecting the rows matching the widgets")
+stats_seconds = Histogram('mmp_stats_seconds', "Time spent computing the selection statistics and histograms (cache misses)")
+density_seconds = Histogram('mmp_density_seconds', "Time spent rasterizing density images")
+serialize_seconds = Histogram('mmp_serialize_seconds', "Time spent serializing document patches")
+filter_cache = Counter('mmp_filter_cache_total', "Lookups of the filter result cache, by result (hit or miss)", labels=('result',))
+selected_rows = Histogram('mmp_selected_rows', "Rows matching the widgets per plot refresh", buckets=rows_buckets)
+sent_bytes = Counter('mmp_sent_bytes_total', "Bytes sent to browsers, by message type", labels=('msgtype',))
+sent_messages = Counter('mmp_sent_messages_total', "Messages sent to browsers, by message type", labels=('msgtype',))
+sessions = Gauge('mmp_sessions', "Open sessions")
+sessions_created = Counter('mmp_sessions_created_total', "Sessions created")
+reloads = Counter('mmp_reloads_total', "Dataset reloads, by result", labels=('result',))
+data_version = Gauge('mmp_data_version', "Version (file mtime in ns) of the current dataset", current_version)
+data_rows = Gauge('mmp_data_rows', "Rows in the current dataset", current_rows)
+private_bytes = Gauge('mmp_process_private_bytes', "Resident anonymous memory of this process (RssAnon)", process_memory('RssAnon'))
+mapped_bytes = Gauge('mmp_process_mapped_bytes', "Resident file-backed memory of this process, shared with other workers (RssFile)", process_memory('RssFile'))
+
+
+def instrument_server():
+    # Count the bytes of every message sent over the websockets and time the
+    # serialization of document patches. Called once per server process
+    if not settings.metrics:
+        return
+    from bokeh.server.connection import ServerConnection
+    from bokeh.server.views.ws import WSHandler
+    if getattr(WSHandler.send_message, 'instrumented', False):
+        return
+
+    send_message = WSHandler.send_message
+    send_patch_document = ServerConnection.send_patch_document
+
+    def counting_send_message(self, message):
+        size = len(message.header_json) + len(message.metadata_json) + len(message.content_json)
+        for header, payload in message.buffers:
+            size += len(payload)
+        sent_bytes.inc(size, message.msgtype)
+        sent_messages.inc(1, message.msgtype)
+        return send_message(self, message)
+    counting_send_message.instrumented = True
+
+    def timed_send_patch_document(self, event):
+        with serialize_seconds.time():
+            return send_patch_document(self, event)
+
+    WSHandler.send_message = counting_send_message
+    ServerConnection.send_patch_document = timed_send_patch_document
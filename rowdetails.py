@@ -0,0 +1,207 @@
+import math
+
+import numpy as np
+import pandas
+from bokeh.colors import named
+from bokeh.models import CustomJS, CustomJSHover, LegendItem
+
+# Lazy tooltips (settings.lazy_tooltips). The plot's data source only holds x,
+# y, the row number in the dataset and a style group code (color, alpha and
+# legend label). The tooltip and tap URL fields of a row are fetched from the
+# /rows route of serve.py when it is hovered or tapped, and kept in a least
+# recently used cache in the browser.
+
+# Tooltip/URL field name -> dataset column
+detail_fields = [
+    ('db', 'db'),
+    ('fsn', 'full_scientific_name'),
+    ('mmpid', 'mmp_ID'),
+    ('apt', 'analysis_project_type'),
+    ('qual', 'quality'),
+    ('comp', 'Completeness'),
+    ('cont', 'Contamination'),
+]
+
+# Most rows served per /rows request, and rows cached per browser tab
+max_rows = 1000
+cache_size = 5000
+
+url = '/rows'
+
+
+def style_groups(dataset):
+    # (uint8 code per row, [(label, color, alpha)] per code)
+    def compute(dataset):
+        columns = dataset.take(slice(None), ['label', 'color', 'alpha'])
+        keys = pandas.MultiIndex.from_arrays([columns['label'], columns['color'], columns['alpha']])
+        codes, groups = pandas.factorize(keys, sort=True)
+        return codes.astype(np.uint8), [tuple(group) for group in groups]
+    return dataset.derived('style_groups', compute)
+
+
+def palette(groups):
+    # One #RRGGBBAA entry per style group, the alpha is part of the color
+    colors = []
+    for label, color, alpha in groups:
+        rgb = getattr(named, color).to_hex() if hasattr(named, color) else color
+        colors.append('%s%02x' % (rgb, int(round(255 * float(alpha)))))
+    return colors or ['grey']
+
+
+def legend_items(dataset, renderer):
+    # One legend entry per style group, in label order, hidden until update_legend
+    # shows it. Items are created once: replacing them would resend the renderer
+    codes, groups = style_groups(dataset)
+    return [LegendItem(label=label, renderers=[renderer], index=0, visible=False) for label, color, alpha in groups]
+
+
+def first_positions(dataset, rows, positions):
+    # {style group code: data source index of its first row among rows}, for the
+    # legend swatches. positions are the data source indices of rows
+    codes, groups = style_groups(dataset)
+    present, first = np.unique(codes[rows], return_index=True)
+    return dict((int(code), int(positions[index])) for code, index in zip(present, first))
+
+
+def json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def lookup(dataset, ids):
+    # {row: {field: value}} for the valid row numbers in ids
+    rows = np.asarray([i for i in ids if 0 <= i < len(dataset)], dtype=np.intp)
+    values = dataset.take(rows, [column for field, column in detail_fields])
+    columns = [(field, values[column]) for field, column in detail_fields]
+    return dict((str(row), dict((field, json_value(values[n])) for field, values in columns)) for n, row in enumerate(rows))
+
+
+# Installs window.mmp_rows (the row cache) once per browser tab
+prelude = """
+if (window.mmp_rows === undefined) {
+    const limit = %(cache_size)d;
+    // "<version>:<row>" -> row fields, least recently used first
+    const entries = new Map();
+    const loading = new Set();
+    const remember = (key, row) => {
+        entries.delete(key);
+        entries.set(key, row);
+        if (entries.size > limit)
+            entries.delete(entries.keys().next().value);
+    };
+    window.mmp_rows = {
+        get(version, id) {
+            const key = version + ":" + id;
+            const row = entries.get(key);
+            if (row !== undefined)
+                remember(key, row);
+            return row;
+        },
+        load(version, ids) {
+            // Fetch the rows that are neither cached nor on their way. Returns a
+            // Promise resolved once they are cached, or null if nothing was missing
+            const missing = ids.filter((id) => !entries.has(version + ":" + id) && !loading.has(version + ":" + id)).slice(0, %(max_rows)d);
+            if (missing.length == 0)
+                return null;
+            for (const id of missing)
+                loading.add(version + ":" + id);
+            return fetch("%(url)s?version=" + version + "&ids=" + missing.join(","))
+                .then((response) => response.ok ? response.json() : {rows: {}})
+                .then((data) => {
+                    for (const [id, row] of Object.entries(data.rows))
+                        remember(version + ":" + id, row);
+                })
+                .catch(() => null)
+                .finally(() => {
+                    for (const id of missing)
+                        loading.delete(version + ":" + id);
+                });
+        },
+    };
+}
+"""
+
+# Tooltip fields are written as @row{<field>}
+formatter_code = """
+const row = window.mmp_rows.get(source.tags[0], value);
+if (row === undefined)
+    return "...";
+const field = row[format];
+if (field == null)
+    return "NaN";
+if (typeof field != "number")
+    return String(field);
+// Same number formatting as bokeh's default tooltip formatter
+if (Math.floor(field) == field)
+    return field.toFixed(0);
+if (Math.abs(field) > 0.1 && Math.abs(field) < 1000)
+    return field.toFixed(3);
+return field.toExponential(3);
+"""
+
+# Fetch the hovered rows, then redraw the tooltip if the mouse did not move meanwhile
+prefetch_code = """
+const ids = cb_data.index.indices.map((i) => source.data.row[i]);
+if (ids.length == 0)
+    return;
+const {sx, sy} = cb_data.geometry;
+window.mmp_rows.hovered = [sx, sy];
+const loaded = window.mmp_rows.load(source.tags[0], ids);
+if (loaded === null)
+    return;
+loaded.then(() => {
+    const [x, y] = window.mmp_rows.hovered;
+    if (x == sx && y == sy)
+        source.inspect.emit([cb_data.renderer, {geometry: cb_data.geometry}]);
+});
+"""
+
+# TapTool: open the record of every tapped row, like OpenURL on the full data source
+tap_code = """
+const version = source.tags[0];
+const ids = source.selected.indices.map((i) => source.data.row[i]);
+const link = (row) => template.replace(/@(\\w+)/g, (match, field) => String(row[field]));
+const missing = [];
+for (const id of ids) {
+    const row = window.mmp_rows.get(version, id);
+    if (row !== undefined)
+        window.open(link(row));
+    else
+        // Opened right away (still inside the click), the address follows once the row is loaded
+        missing.push([id, window.open("")]);
+}
+if (missing.length > 0) {
+    const loaded = window.mmp_rows.load(version, missing.map(([id, tab]) => id)) || Promise.resolve();
+    loaded.then(() => {
+        for (const [id, tab] of missing) {
+            const row = window.mmp_rows.get(version, id);
+            if (tab != null && row !== undefined)
+                tab.location.href = link(row);
+        }
+    });
+}
+"""
+
+
+def with_prelude(code):
+    return prelude % dict(cache_size=cache_size, max_rows=max_rows, url=url) + code
+
+
+def tooltips(tooltips):
+    # TOOLTIPS with @<field> replaced by the lazily fetched @row{<field>}
+    return [(name, '@row{%s}' % field.lstrip('@')) for name, field in tooltips]
+
+
+def hover_formatter(source):
+    return CustomJSHover(args=dict(source=source), code=with_prelude(formatter_code))
+
+
+def prefetch_callback(source):
+    return CustomJS(args=dict(source=source), code=with_prelude(prefetch_code))
+
+
+def tap_callback(source, template):
+    return CustomJS(args=dict(source=source, template=template), code=with_prelude(tap_code))
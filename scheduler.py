@@ -0,0 +1,79 @@
+import math
+import time
+from functools import partial
+
+from tornado.ioloop import IOLoop
+
+import settings
+
+
+class UpdateScheduler(object):
+    # Coalesces widget changes into as few update() runs as possible.
+    #
+    # request() only marks the plot as stale and schedules one run on the
+    # session's event loop; further requests before that run are merged into
+    # it. update() reads the widgets when it runs, so intermediate states of a
+    # burst (e.g. a slider drag) are dropped. Runs are spaced at least
+    # `interval` milliseconds apart, so a long drag still refreshes the plot
+    # regularly instead of queueing one recompute per event. While work started
+    # with background() runs, requests wait for it to be applied.
+
+    def __init__(self, doc, update, interval=None):
+        self.doc = doc
+        self.update = update
+        self.interval = settings.update_interval if interval is None else interval
+        self.pending = False
+        self.running = False
+        self.last_run = None
+        # Counters, e.g. for benchmarks/bench_scheduler.py
+        self.requests = 0
+        self.runs = 0
+
+    def request(self, attr, old, new):
+        # Signature matches on_change callbacks
+        self.requests += 1
+        if self.pending:
+            return
+        self.pending = True
+        if not self.running:
+            self._schedule()
+
+    def _schedule(self):
+        wait = 0
+        if self.last_run is not None:
+            wait = self.interval - 1000 * (time.perf_counter() - self.last_run)
+        if wait > 0:
+            self.doc.add_timeout_callback(self._run, int(math.ceil(wait)))
+        else:
+            self.doc.add_next_tick_callback(self._run)
+
+    def _run(self):
+        self.pending = False
+        self.last_run = time.perf_counter()
+        self.runs += 1
+        self.update()
+
+    def background(self, compute, apply):
+        # Run compute() in a worker thread, so the event loop serves the other
+        # sessions meanwhile, then apply(its result) with the document locked.
+        # compute must not use the session's main.py module, which is cleared
+        # when the session ends; its result is dropped then (and for documents
+        # without a session, see server_lifecycle.warm_up)
+        self.running = True
+        loop = IOLoop.current()
+        loop.add_future(loop.run_in_executor(None, compute), self._finished(apply))
+
+    def _finished(self, apply):
+        def finished(future):
+            if self.doc.session_context is not None:
+                self.doc.add_next_tick_callback(partial(self._apply, apply, future))
+        return finished
+
+    def _apply(self, apply, future):
+        self.running = False
+        try:
+            apply(future.result())
+        finally:
+            # apply() may have started more background work
+            if self.pending and not self.running:
+                self._schedule()
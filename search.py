@@ -0,0 +1,224 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+import pandas
+
+import columnar
+
+# Search box: rows whose scientific name or MMP ID contains the query (case
+# insensitive). Queries of one or two characters match the start of the name
+# or ID instead. Built once per dataset, over the distinct values of each
+# column:
+#   - the values in sorted order, for prefixes (binary search)
+#   - the values containing each trigram (3 UTF-8 bytes), for substrings: the
+#     posting lists of the query's trigrams are intersected and the remaining
+#     values checked (one by one, or by a vectorized scan when there are many)
+#   - the rows of each value (rows sorted by value code)
+# A scan keeps where the query occurs, so the next query typed after it (the
+# same text plus more) only checks those places. The masks of the last
+# queries are kept too, shared by the sessions, for repeated queries.
+
+search_columns = ['full_scientific_name', 'mmp_ID']
+
+# Shorter queries match prefixes only
+gram = 3
+
+# Masks kept per SearchIndex, see SearchIndex.mask()
+recent_queries = 8
+
+
+def normalize(query):
+    return query.strip().lower()
+
+
+def trigrams(data):
+    # (sorted distinct trigram codes, start of each one's postings, postings) of
+    # the NUL separated values in data: the ids of the values containing trigram
+    # grams[n] are postings[starts[n]:starts[n + 1]], ascending
+    if len(data) < gram:
+        return np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+    separator = data == 0
+    # Value id of every byte, and the positions of trigrams within a value
+    ids = np.cumsum(separator, dtype=np.int32) - separator
+    positions = np.flatnonzero(~(separator[:-2] | separator[1:-1] | separator[2:]))
+    # One key per (trigram, value), sorted by trigram then value
+    keys = ids[positions].astype(np.int64)
+    for shift, offset in ((48, 0), (40, 1), (32, 2)):
+        keys |= data[positions + offset].astype(np.int64) << shift
+    keys = np.unique(keys)
+    grams, starts = np.unique(keys >> 32, return_index=True)
+    return grams, np.append(starts, len(keys)), (keys & 0xffffffff).astype(np.int32)
+
+
+def query_grams(query):
+    data = query.encode('utf-8')
+    return sorted(set((data[i] << 16) | (data[i + 1] << 8) | data[i + 2] for i in range(len(data) - 2)))
+
+
+class TextIndex(object):
+    # Index of one text column, from its dictionary encoding: value code per row
+    # (-1 for missing) and the distinct values
+
+    def __init__(self, codes, values):
+        self.size = len(codes)
+        self.values = [value.lower() for value in values]
+        # Value ids in the order of their lowercased value
+        order = sorted(range(len(self.values)), key=self.values.__getitem__)
+        self.sorted = [self.values[i] for i in order]
+        self.sorted_ids = np.asarray(order, dtype=np.int32)
+        # Lowercased values as NUL terminated UTF-8, and where each one starts
+        self.data = np.frombuffer('\x00'.join(self.values).encode('utf-8') + b'\x00', dtype=np.uint8)
+        self.value_starts = np.concatenate([[0], np.flatnonzero(self.data == 0)[:-1] + 1])
+        self.byte_counts = np.bincount(self.data, minlength=256)
+        self.grams, self.starts, self.postings = trigrams(self.data)
+        # Rows grouped by value: rows[row_starts[i]:row_starts[i + 1]] have value i
+        codes = np.asarray(codes, dtype=np.int32)
+        rows = np.argsort(codes, kind='stable').astype(np.int32)
+        self.rows = rows[np.count_nonzero(codes < 0):]
+        self.row_starts = np.searchsorted(codes[self.rows], np.arange(len(self.values) + 1))
+        self.codes = codes
+        # (query, positions in data, value id of each, value ids) of the last scanned query, see refine()
+        self.last = None
+
+    def prefix(self, query):
+        # Ids of the values starting with query
+        lo = bisect_left(self.sorted, query)
+        hi = bisect_left(self.sorted, query + '\U0010ffff', lo)
+        return self.sorted_ids[lo:hi]
+
+    def substring(self, query):
+        # Ids of the values containing query (len(query) >= gram)
+        codes = query_grams(query)
+        postings = []
+        for code in codes:
+            n = np.searchsorted(self.grams, code)
+            if n == len(self.grams) or self.grams[n] != code:
+                return self.postings[:0]
+            if self.starts[n + 1] - self.starts[n] < len(self.values):
+                # (a trigram in every value selects nothing)
+                postings.append(self.postings[self.starts[n]:self.starts[n + 1]])
+        postings.sort(key=len)
+        ids = postings[0] if postings else np.arange(len(self.values), dtype=np.int32)
+        for other in postings[1:]:
+            # Keep the ids also in `other`, a binary search per remaining id
+            positions = np.minimum(np.searchsorted(other, ids), len(other) - 1)
+            ids = ids[other[positions] == ids]
+        if len(query.encode('utf-8')) == gram:
+            return ids
+        # Every trigram present does not mean the query is, check the candidates
+        if 200 * len(ids) > len(self.data):
+            # Many of them: one vectorized pass over all values is cheaper, or over
+            # the occurrences of the last scanned query when this one extends it
+            last = self.last
+            if last is not None and query.startswith(last[0]):
+                return self.refine(query, *last)
+            return self.scan(query)
+        values = self.values
+        return np.asarray([i for i in ids.tolist() if query in values[i]], dtype=np.int32)
+
+    def scan(self, query):
+        # Ids of the values containing query: its bytes are compared around every
+        # occurrence of its least frequent byte in the values' data
+        pattern = np.frombuffer(query.encode('utf-8'), dtype=np.uint8)
+        anchor = int(np.argmin(self.byte_counts[pattern]))
+        positions = np.flatnonzero(self.data == pattern[anchor]) - anchor
+        positions = positions[(positions >= 0) & (positions <= len(self.data) - len(pattern))]
+        for offset in range(len(pattern)):
+            if offset != anchor:
+                positions = positions[self.data[positions + offset] == pattern[offset]]
+        positions = positions.astype(np.int32)
+        owners = (np.searchsorted(self.value_starts, positions, side='right') - 1).astype(np.int32)
+        return self.found(query, positions, owners)
+
+    def refine(self, query, previous, positions, owners, ids):
+        # Ids of the values containing query, which starts with the last scanned
+        # query `previous`: only the bytes after each occurrence of it are
+        # compared. Occurrences are dropped at their first differing byte, so the
+        # next one read follows a matched, non-NUL byte and is still in the data
+        # (it ends with a NUL)
+        pattern = np.frombuffer(query.encode('utf-8'), dtype=np.uint8)
+        count = len(positions)
+        for offset in range(len(previous.encode('utf-8')), len(pattern)):
+            match = self.data[positions + offset] == pattern[offset]
+            positions, owners = positions[match], owners[match]
+        if len(positions) == count:
+            self.last = (query, positions, owners, ids)
+            return ids
+        return self.found(query, positions, owners)
+
+    def found(self, query, positions, owners):
+        # Ids of the values owning the occurrences of query at positions, kept for refine()
+        hit = np.zeros(len(self.values), dtype=bool)
+        hit[owners] = True
+        ids = np.flatnonzero(hit).astype(np.int32)
+        self.last = (query, positions, owners, ids)
+        return ids
+
+    def matches(self, query):
+        return self.prefix(query) if len(query) < gram else self.substring(query)
+
+    def mask(self, query, mask=None):
+        # Rows whose value matches the normalized query, or-ed into mask
+        if mask is None:
+            mask = np.zeros(self.size, dtype=bool)
+        ids = self.matches(query)
+        total = self.size
+        if len(ids) < len(self.values) // 8:
+            starts = self.row_starts[ids]
+            lengths = self.row_starts[ids + 1] - starts
+            total = int(lengths.sum())
+        if total < self.size // 8:
+            # Few rows: gather them from the value groups
+            ends = np.cumsum(lengths)
+            positions = np.arange(total) + np.repeat(starts - (ends - lengths), lengths)
+            mask[self.rows[positions]] = True
+        else:
+            hit = np.zeros(len(self.values) + 1, dtype=bool)
+            hit[ids] = True
+            # Missing values (-1) pick the last, unset entry
+            mask |= hit[self.codes]
+        return mask
+
+
+class SearchIndex(object):
+
+    def __init__(self, dataset):
+        self.size = len(dataset)
+        # Normalized query -> read-only mask, least recently used first
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+        self.columns = []
+        for name in search_columns:
+            if name in dataset.encoded:
+                codes, values = dataset.encoded[name][0], columnar.strings(dataset.encoded[name][1])
+            else:
+                codes, values = pandas.factorize(dataset.column(name))
+            self.columns.append(TextIndex(codes, [str(value) for value in values]))
+
+    def mask(self, query):
+        # Rows matching the query in any of the search columns (read-only)
+        query = normalize(query)
+        with self.lock:
+            mask = self.recent.get(query)
+            if mask is not None:
+                self.recent.move_to_end(query)
+                return mask
+        mask = np.zeros(self.size, dtype=bool)
+        if query:
+            for column in self.columns:
+                column.mask(query, mask)
+        else:
+            mask[:] = True
+        mask.setflags(write=False)
+        with self.lock:
+            self.recent[query] = mask
+            while len(self.recent) > recent_queries:
+                self.recent.popitem(last=False)
+        return mask
+
+
+def index(dataset):
+    # SearchIndex of a dataset, built on first use (server_lifecycle builds it at startup)
+    return dataset.derived('search', SearchIndex)
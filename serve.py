@@ -0,0 +1,142 @@
+import argparse
+import json
+import logging
+import sys
+from os.path import abspath, basename, dirname
+
+# Runs the explorer like "bokeh serve mmp_interactive/", plus the HTTP routes
+# the bokeh CLI cannot add:
+#   /metrics - counters and timings of this process (metrics.py), Prometheus text format
+#   /rows    - tooltip fields of single rows, for settings.lazy_tooltips (rowdetails.py)
+#   /export  - rows matching the widget filters, streamed as CSV or NDJSON (export.py)
+#
+#   python mmp_interactive/serve.py --port 5006 --allow-websocket-origin example.org
+#
+# --num-procs N forks N worker processes sharing the port. Each loads the
+# dataset itself (server_lifecycle.py); from a compact input.col the columns and
+# filter indexes are memory-mapped, so the workers share one copy of them.
+# Sessions stay on the worker their websocket connected to, /metrics and /rows
+# answer from whichever worker accepts the request.
+
+app_path = dirname(abspath(__file__))
+sys.path.insert(0, app_path)
+
+from bokeh.application import Application
+from bokeh.application.handlers import DirectoryHandler
+from bokeh.server.server import Server
+from tornado.ioloop import IOLoop
+from tornado.web import RequestHandler
+
+import datastore
+import export
+import metrics
+import rowdetails
+import settings
+import sqlstore
+
+
+class MetricsHandler(RequestHandler):
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.render())
+
+
+class RowsHandler(RequestHandler):
+    # GET /rows?version=<dataset version>&ids=1,2,3 -> {"version": ..., "rows": {"1": {...}, ...}}
+    # Row numbers refer to a dataset version, other versions get 409 Conflict
+
+    def get(self):
+        if settings.backend == 'sqlite':
+            # Lazy tooltips need the dataset in memory, main.py refuses them with this backend
+            self.send_error(501, reason="/rows is not available with the sqlite backend")
+            return
+        dataset = datastore.get()
+        version = str(dataset.version)
+        try:
+            ids = [int(i) for i in self.get_argument('ids', '').split(',') if i][:rowdetails.max_rows]
+        except ValueError:
+            self.send_error(400)
+            return
+        self.set_header('Content-Type', 'application/json')
+        if self.get_argument('version', version) != version:
+            self.set_status(409)
+            self.write(json.dumps({'version': version, 'rows': {}}))
+            return
+        self.set_header('Cache-Control', 'private, max-age=3600')
+        self.write(json.dumps({'version': version, 'rows': rowdetails.lookup(dataset, ids)}))
+
+
+class ExportHandler(RequestHandler):
+    # GET /export?format=csv|ndjson&columns=a,b&<filter parameters of export.py>
+    # Chunks are flushed one at a time, each waiting for the client to take the
+    # previous one, so a large result never sits in memory as a whole. They are
+    # read in a worker thread, so sessions are served meanwhile. With the sqlite
+    # backend the rows are queried from input.sqlite, the dataset is not loaded
+
+    async def get(self):
+        dataset = sqlstore.get() if settings.backend == 'sqlite' else datastore.get()
+        parameters = dict((name, self.get_argument(name)) for name in self.request.arguments)
+        unknown = sorted(set(parameters) - set(export.parameters))
+        if unknown:
+            # A misspelled filter must not export every row
+            self.send_error(400, reason="unknown parameters: %s" % ', '.join(unknown))
+            return
+        format = parameters.pop('format', 'csv')
+        names = parameters.pop('columns').split(',') if parameters.get('columns') else export.columns(dataset)
+        try:
+            state = export.filter_state(parameters)
+        except ValueError as error:
+            self.send_error(400, reason=str(error))
+            return
+        if format not in export.formats or any(name not in dataset.names for name in names):
+            self.send_error(400)
+            return
+        self.set_header('Content-Type', export.formats[format])
+        self.set_header('Content-Disposition', 'attachment; filename="mmp-%s.%s"' % (dataset.version, format))
+        self.set_header('X-Data-Version', str(dataset.version))
+        if settings.backend == 'sqlite':
+            frames = export.query_frames(dataset, state, names)
+        else:
+            frames = export.frames(dataset, export.select(dataset, state), names)
+        chunks = export.chunks(frames, names, format)
+        while True:
+            chunk = await IOLoop.current().run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            self.write(chunk)
+            await self.flush()
+
+
+def extra_patterns():
+    patterns = [(r'/rows', RowsHandler), (r'/export', ExportHandler)]
+    if settings.metrics:
+        patterns.append((r'/metrics', MetricsHandler))
+    return patterns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the MMP interactive explorer")
+    parser.add_argument('--port', type=int, default=5006)
+    parser.add_argument('--address', default=None)
+    parser.add_argument('--allow-websocket-origin', action='append', default=None, metavar='HOST[:PORT]')
+    parser.add_argument('--num-procs', type=int, default=1, help="worker processes, 0 for one per CPU")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    route = '/' + basename(app_path)
+    server = Server(
+        {route: Application(DirectoryHandler(filename=app_path))},
+        port=args.port,
+        address=args.address,
+        allow_websocket_origin=args.allow_websocket_origin,
+        extra_patterns=extra_patterns(),
+        num_procs=args.num_procs,
+    )
+    server.start()
+    logging.info("Explorer running at http://%s:%d%s", args.address or 'localhost', args.port, route)
+    server.io_loop.start()
+
+
+if __name__ == '__main__':
+    main()
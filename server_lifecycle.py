@@ -0,0 +1,102 @@
+import logging
+import sys
+import time
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+import datastore
+import metrics
+import search
+import settings
+import sqlstore
+
+log = logging.getLogger(__name__)
+
+# True while a new dataset is being read in the background
+reloading = False
+# Periodic check_for_new_data() of this process
+watcher = None
+
+
+async def reload():
+    # Parse the new file in a worker thread, so sessions stay responsive, then swap it in
+    global reloading
+    try:
+        dataset = await IOLoop.current().run_in_executor(None, datastore.read)
+        # The search index too, the first keystroke on the new data should not wait for it
+        await IOLoop.current().run_in_executor(None, search.index, dataset)
+        datastore.swap(dataset)
+        metrics.reloads.inc(1, 'ok')
+        log.info("Loaded %d rows from %s", len(dataset), dataset.path)
+    except Exception:
+        metrics.reloads.inc(1, 'failed')
+        log.exception("Reloading %s failed, keeping the current dataset", settings.input_path)
+    finally:
+        reloading = False
+
+
+def check_for_new_data():
+    global reloading
+    if not reloading and datastore.changed():
+        reloading = True
+        IOLoop.current().add_callback(reload)
+
+
+async def warm_up(server_context):
+    # Render one document nobody connects to, once the server is serving: the
+    # first visitor then finds main.py's imports done, the arrays derived from
+    # the dataset computed and the default view in the filter result cache.
+    # The search index follows in a worker thread, like in reload(), so the
+    # server answers meanwhile (a search typed before it is done builds it too)
+    start = time.perf_counter()
+    try:
+        document = server_context.application_context.application.create_document()
+        # No session ever ends for it: unsubscribe it and drop its main.py module
+        # (left in sys.modules until then) like the end of a session does, else
+        # the dataset it was rendered with would never be freed
+        datastore.unsubscribe(document)
+        document.callbacks.destroy()
+        document.modules.destroy()
+        del document
+        log.info("Warmed up in %.2fs", time.perf_counter() - start)
+        if settings.backend != 'sqlite':
+            await IOLoop.current().run_in_executor(None, search.index, datastore.get())
+            log.info("Search index built after %.2fs", time.perf_counter() - start)
+    except Exception:
+        log.exception("Warm up failed")
+
+
+def on_server_loaded(server_context):
+    if settings.backend == 'sqlite' and (settings.filter_mode != 'data' or settings.lazy_tooltips):
+        # Bokeh logs and ignores exceptions of this hook: refuse to serve instead
+        sys.exit("MMP_BACKEND=sqlite needs MMP_FILTER_MODE=data and MMP_LAZY_TOOLTIPS=0")
+    if settings.backend == 'sqlite':
+        # Sessions query input.sqlite; a file replaced by the ETL is opened by the sessions created afterwards
+        sqlstore.get()
+    else:
+        # Parse input.tsv once per server process, before the first session is created
+        datastore.load()
+    metrics.instrument_server()
+    IOLoop.current().add_callback(warm_up, server_context)
+    # Pick up data refreshed by update_and_deploy_input_data.py without a restart
+    global watcher
+    if settings.reload_interval > 0 and settings.backend != 'sqlite':
+        watcher = PeriodicCallback(check_for_new_data, 1000 * settings.reload_interval)
+        watcher.start()
+
+
+def on_session_created(session_context):
+    metrics.sessions.inc()
+    metrics.sessions_created.inc()
+
+
+def on_session_destroyed(session_context):
+    metrics.sessions.inc(-1)
+    datastore.unsubscribe(session_context._document)
+
+
+def on_server_unloaded(server_context):
+    if watcher is not None:
+        watcher.stop()
+    datastore.reset()
+    sqlstore.reset()
@@ -0,0 +1,53 @@
+import os
+from os.path import join
+
+# Runtime configuration for the explorer. Everything can be overridden from the
+# environment, e.g. "docker run -e MMP_INPUT_PATH=/data/input.tsv ..."
+
+# Path to the dataset written by update_and_deploy_input_data.py
+input_path = os.environ.get('MMP_INPUT_PATH', join(os.getcwd(), 'mmp_interactive/inputdata/input.tsv'))
+
+# How selections reach the browser:
+#   'data' - the selected rows are resent as source.data on every change
+#   'view' - all rows are sent once, changes only send the selected row indices (CDSView/IndexFilter)
+#   'client' - all rows and filter columns are sent once, filtering runs in the browser (CustomJSFilter)
+filter_mode = os.environ.get('MMP_FILTER_MODE', 'data')
+
+# Minimum time between two recomputes of the plot (milliseconds). Widget changes
+# within that window are merged into one update()
+update_interval = int(os.environ.get('MMP_UPDATE_INTERVAL', 100))
+
+# Slider property that triggers an update: 'value' refreshes while dragging,
+# 'value_throttled' only when the slider is released
+slider_event = os.environ.get('MMP_SLIDER_EVENT', 'value')
+
+# Selections with more points in view than this are drawn as a density image
+# instead of one circle per row (0 disables). Not used in 'client' filter mode
+density_threshold = int(os.environ.get('MMP_DENSITY_THRESHOLD', 100000))
+
+# Screen pixels per density grid cell
+density_cell_pixels = int(os.environ.get('MMP_DENSITY_CELL_PIXELS', 4))
+
+# Seconds between checks for a refreshed dataset file; a new file is loaded in
+# the background and pushed to all open sessions (0 disables)
+reload_interval = float(os.environ.get('MMP_RELOAD_INTERVAL', 30))
+
+# Collect timings and counters (see metrics.py), served on /metrics by serve.py
+metrics = os.environ.get('MMP_METRICS', '1') not in ('0', 'false', 'no', '')
+
+# Send only x, y, row numbers and style codes to the browser; tooltip and tap
+# URL fields are fetched per hovered row from serve.py's /rows route
+lazy_tooltips = os.environ.get('MMP_LAZY_TOOLTIPS', '0') not in ('0', 'false', 'no', '')
+
+# Megabytes of filter results (selected rows and statistics per widget state)
+# kept per dataset or input.sqlite and shared by all sessions of a process (0 disables)
+filter_cache_mb = float(os.environ.get('MMP_FILTER_CACHE_MB', 64))
+
+# Where the rows of an update come from: 'memory' (the dataset loaded by
+# datastore.py) or 'sqlite' (queries on input.sqlite, see sqlstore.py; the
+# dataset is not loaded). 'sqlite' needs filter mode 'data' without lazy tooltips
+backend = os.environ.get('MMP_BACKEND', 'memory')
+
+# SQLite connections kept open per server process with backend 'sqlite' (more
+# are opened while all of them are in use, and closed afterwards)
+sqlite_connections = int(os.environ.get('MMP_SQLITE_CONNECTIONS', 4))
@@ -0,0 +1,378 @@
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+import numpy as np
+import pandas
+
+import datastore
+import density
+import filterindex
+import search
+import settings
+import summary
+
+# SQLite copy of input.tsv (input.sqlite), written by
+# update_and_deploy_input_data.py --sqlite, for settings.backend 'sqlite'. The
+# dataset is not loaded into the server processes: every update runs one
+# parameterized query, answered from the indexes on the filter columns, that
+# returns only the columns drawn. The database file is memory-mapped by SQLite,
+# so the pages it reads are shared by the server processes like input.col.
+#
+# Table entries: the row number (position in input.tsv) as primary key, then
+# every column of input.tsv, integers as INTEGER, other numbers as REAL (missing
+# values NULL) and text as TEXT. SQLite column names are case insensitive, so a column whose name only
+# differs in case from an earlier one (DB, db) gets a suffix; table columns
+# maps the dataset's column names to those of entries, table quantiles holds
+# quantiles of the range filter columns and the row count of every category.
+# SQLite's planner cannot tell how many rows a range matches, so Store.plan()
+# picks the index from those: the filter matching the fewest rows, or no
+# index (a scan in row order) when none of them is selective.
+#
+#   python mmp_interactive/sqlstore.py inputdata/input.tsv   (writes inputdata/input.sqlite)
+
+table = 'entries'
+
+# Columns with an index: the range and categorical filters
+indexed_columns = [column for field, column in filterindex.range_filters] + [column for field, (column, values) in filterindex.category_filters]
+
+# Rows read from input.tsv and inserted per transaction
+chunk_rows = 100000
+
+# Bytes of the database file SQLite maps into each process
+mmap_bytes = 2 ** 30
+
+# Quantiles stored per range column
+quantile_count = 257
+
+# Share of the rows above which reading the whole table beats an index lookup per row
+scan_share = 0.1
+
+_lock = threading.Lock()
+_current = None
+
+
+def path_for(path):
+    # SQLite copy of a dataset file: input.tsv -> input.sqlite
+    return os.path.splitext(path)[0] + '.sqlite'
+
+
+def quoted(name):
+    return '"%s"' % str(name).replace('"', '""')
+
+
+def sql_names(names):
+    # Column of entries for each dataset column, unique ignoring case
+    taken = set(['row'])
+    columns = []
+    for name in names:
+        column = str(name)
+        while column.lower() in taken:
+            column += '_'
+        taken.add(column.lower())
+        columns.append(column)
+    return columns
+
+
+def sql_type(values):
+    kind = values.dtype.kind
+    return 'INTEGER' if kind in 'biu' else 'REAL' if kind == 'f' else 'TEXT'
+
+
+def write(chunks, path):
+    # Write the DataFrames of `chunks` (consecutive rows of one table) to a new
+    # database at path, then index it. Replaces path in one step
+    part = path + '.part'
+    if os.path.exists(part):
+        os.remove(part)
+    connection = sqlite3.connect(part)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        start = 0
+        for chunk in chunks:
+            # The index pandas wrote is replaced by the row number
+            chunk = chunk[[name for name in chunk.columns if not str(name).startswith('Unnamed: ')]]
+            if start == 0:
+                columns = dict(zip(chunk.columns, sql_names(chunk.columns)))
+                connection.execute('CREATE TABLE %s (%s)' % (table, ', '.join(['"row" INTEGER PRIMARY KEY'] + [
+                    '%s %s' % (quoted(columns[name]), sql_type(chunk[name])) for name in chunk.columns])))
+                connection.execute('CREATE TABLE columns (name TEXT, "column" TEXT)')
+                connection.executemany('INSERT INTO columns VALUES (?, ?)', [(str(name), column) for name, column in columns.items()])
+                insert = 'INSERT INTO %s VALUES (%s)' % (table, ', '.join('?' * (len(chunk.columns) + 1)))
+            # NaN is stored as NULL
+            values = chunk.astype(object).where(chunk.notna(), None)
+            values.insert(0, 'row', range(start, start + len(chunk)))
+            with connection:
+                connection.executemany(insert, values.itertuples(index=False, name=None))
+            start += len(chunk)
+        for name in indexed_columns:
+            connection.execute('CREATE INDEX %s ON %s (%s)' % (quoted(table + '_' + columns[name]), table, quoted(columns[name])))
+        # Share of the rows up to each stored value: the quantiles of the range
+        # columns, every value of the categorical ones
+        connection.execute('CREATE TABLE quantiles (name TEXT, value, share REAL)')
+        for field, name in filterindex.range_filters:
+            column = quoted(columns[name])
+            values = np.fromiter((value for value, in connection.execute(
+                'SELECT %s FROM %s WHERE %s IS NOT NULL ORDER BY 1' % (column, table, column))), dtype=float)
+            ranks = np.unique(np.linspace(0, len(values) - 1, quantile_count).round().astype(int)) if len(values) else []
+            connection.executemany('INSERT INTO quantiles VALUES (?, ?, ?)', [(name, values[rank], (rank + 1.0) / start) for rank in ranks])
+        for field, (name, options) in filterindex.category_filters:
+            column = quoted(columns[name])
+            connection.executemany('INSERT INTO quantiles VALUES (?, ?, ?)', [(name, value, count / float(start)) for value, count in connection.execute(
+                'SELECT %s, COUNT(*) FROM %s WHERE %s IS NOT NULL GROUP BY 1' % (column, table, column))])
+        # Statistics for the query planner, to pick the most selective index
+        connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(part, path)
+    return path
+
+
+def convert(path, target=None):
+    # Write the SQLite copy of a dataset TSV (to path_for(path) by default), reading it in chunks
+    return write(pandas.read_csv(path, sep='\t', chunksize=chunk_rows), target or path_for(path))
+
+
+def where(state, columns):
+    # (SQL condition, parameters) of a filterindex.FilterState, with the same
+    # semantics as filterindex.Selection: rows missing a range column never
+    # match, "All" matches every row. columns maps dataset to table columns
+    clauses, parameters = [], []
+    for field, column in filterindex.range_filters:
+        clauses.append('%s BETWEEN ? AND ?' % quoted(columns[column]))
+        parameters.extend(float(bound) for bound in getattr(state, field))
+    for field, (column, values) in filterindex.category_filters:
+        value = getattr(state, field)
+        if value != 'All':
+            clauses.append('%s = ?' % quoted(columns[column]))
+            parameters.append(value)
+    query = search.normalize(state.search)
+    if query:
+        # LIKE is case insensitive (ASCII); short queries match prefixes, like search.py
+        pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = pattern + '%' if len(query) < search.gram else '%' + pattern + '%'
+        clauses.append('(%s)' % ' OR '.join("%s LIKE ? ESCAPE '\\'" % quoted(columns[column]) for column in search.search_columns))
+        parameters.extend(pattern for column in search.search_columns)
+    return ' AND '.join(clauses), parameters
+
+
+class Pool(object):
+    # Read-only connections to one database, handed to one thread at a time.
+    # connection() never waits (it may run on the event loop): when all are in
+    # use it opens another one; at most `size` are kept open once returned
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = max(1, size)
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    def open(self):
+        connection = sqlite3.connect('file:%s?mode=ro' % pathname2url(self.path), uri=True, check_same_thread=False)
+        connection.execute('PRAGMA mmap_size = %d' % mmap_bytes)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self.open()
+        try:
+            yield connection
+        finally:
+            with self.lock:
+                keep = self.idle.qsize() < self.size
+                if keep:
+                    self.idle.put(connection)
+            if not keep:
+                connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class Rows(object):
+    # Columns of the rows a query returned. Positions are those of the result,
+    # `rows` holds the row number of each (position in the dataset)
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name):
+        return self.columns[name]
+
+
+class Store(object):
+    # Queries on one database file, in place of a datastore.Dataset
+
+    def __init__(self, path, connections=4):
+        self.path = path
+        self.signature = datastore.signature(path)
+        self.version = self.signature[1]
+        self.pool = Pool(path, connections)
+        # Query results per widget state, shared by the sessions using this file (see main.py)
+        self.results = filterindex.ResultCache(int(settings.filter_cache_mb * 2 ** 20))
+        with self.pool.connection() as connection:
+            # Dataset column -> column of entries, in file order
+            self.columns = OrderedDict(connection.execute('SELECT name, "column" FROM columns ORDER BY rowid'))
+            types = dict((column, kind) for cid, column, kind, notnull, default, key in connection.execute('PRAGMA table_info(%s)' % table))
+            self.total = connection.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+            quantiles = connection.execute('SELECT name, value, share FROM quantiles ORDER BY rowid').fetchall()
+        self.names = list(self.columns)
+        self.numeric = set(name for name, column in self.columns.items() if types[column] in ('INTEGER', 'REAL'))
+        # Slider bounds, from the indexes
+        self.bounds = {}
+        for field, column in filterindex.range_filters:
+            self.bounds[column] = tuple(float(value) for value in self.range(column))
+        with self.pool.connection() as connection:
+            self.databases = [value for value, in connection.execute(
+                'SELECT DISTINCT %s FROM %s WHERE %s IS NOT NULL ORDER BY 1' % (quoted(self.columns['DB']), table, quoted(self.columns['DB'])))]
+        # Column -> (values, share of the rows up to each) of the range columns,
+        # column -> {value: share of the rows} of the categorical ones
+        self.shares = {}
+        for name, value, share in quantiles:
+            self.shares.setdefault(name, []).append((value, share))
+        for field, column in filterindex.range_filters:
+            values, shares = zip(*self.shares[column]) if column in self.shares else ((), ())
+            self.shares[column] = (np.array(values, dtype=float), np.array(shares, dtype=float))
+        for field, (column, options) in filterindex.category_filters:
+            self.shares[column] = dict(self.shares.get(column, []))
+        # Histogram bin edges per axis column, see edges()
+        self._edges = {}
+
+    def __len__(self):
+        return self.total
+
+    def range(self, name):
+        # (minimum, maximum) of a column, None when it has no value
+        column = quoted(self.columns[name])
+        with self.pool.connection() as connection:
+            return connection.execute('SELECT MIN(%s), MAX(%s) FROM %s' % (column, column, table)).fetchone()
+
+    def share(self, state, column):
+        # Estimated share of the rows the filter of a state on column matches,
+        # None for a categorical filter set to "All"
+        for field, name in filterindex.range_filters:
+            if name == column:
+                low, high = getattr(state, field)
+                values, shares = self.shares[column]
+                if not len(values):
+                    return 0.0
+                return float(np.interp(high, values, shares, left=0.0) - np.interp(low, values, shares, left=0.0))
+        for field, (name, options) in filterindex.category_filters:
+            if name == column:
+                value = getattr(state, field)
+                return None if value == 'All' else self.shares[column].get(value, 0.0)
+
+    def plan(self, state):
+        # Index to answer a state with ("INDEXED BY ..."), or "NOT INDEXED" to read the table in row order
+        shares = dict((column, self.share(state, column)) for column in indexed_columns)
+        column = min((column for column in indexed_columns if shares[column] is not None), key=shares.get)
+        if shares[column] > scan_share:
+            return 'NOT INDEXED'
+        return 'INDEXED BY %s' % quoted(table + '_' + self.columns[column])
+
+    def read(self, sql, parameters, names):
+        # (row numbers, {name: values}) of a query selecting the row number, then the columns `names`
+        with self.pool.connection() as connection:
+            frame = pandas.read_sql_query(sql, connection, params=parameters)
+        columns = {}
+        for position, name in enumerate(names):
+            values = frame.iloc[:, position + 1].values
+            # A column without any value in the result comes back as objects
+            columns[name] = values.astype(float) if name in self.numeric and values.dtype.kind == 'O' else values
+        return frame.iloc[:, 0].values, columns
+
+    def select(self, state, names, after=None, limit=None):
+        # Rows matching a filterindex.FilterState with the given columns, in row
+        # order; only rows after the row number `after`, at most `limit` of them
+        condition, parameters = where(state, self.columns)
+        if after is not None:
+            condition += ' AND "row" > ?'
+            parameters.append(int(after))
+        names = list(names)
+        sql = 'SELECT "row", %s FROM %s %s WHERE %s ORDER BY "row"' % (
+            ', '.join(quoted(self.columns[name]) for name in names), table, self.plan(state), condition)
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+        return Rows(*self.read(sql, parameters, names))
+
+    def summarize(self, state, x_name, y_name):
+        # ((row numbers, X values, Y values, density.channel_codes() of the rows
+        # matching a state, summary.Summary of them), seconds it took or None
+        # when cached). Run by main.py in a worker thread, the result is cached
+        # in results for the other sessions
+        key = (state, x_name, y_name)
+        results = self.results.get(key)
+        if results is not None:
+            return results, None
+        start = time.perf_counter()
+        selected = self.select(state, set([x_name, y_name, 'DB']))
+        x, y, databases = selected.column(x_name), selected.column(y_name), selected.column('DB')
+        statistics = summary.summarize_values(x, y, databases, self.databases, self.edges(x_name), self.edges(y_name))
+        results = self.results.put(key, (selected.rows, x, y, density.channel_codes(databases), statistics))
+        return results, time.perf_counter() - start
+
+    def take(self, rows, names):
+        # Columns of the given rows (ascending row numbers), like datastore.Dataset.take
+        names = list(names)
+        sql = 'SELECT "row", %s FROM %s WHERE "row" IN (SELECT value FROM json_each(?)) ORDER BY "row"' % (
+            ', '.join(quoted(self.columns[name]) for name in names), table)
+        return self.read(sql, [json.dumps(np.asarray(rows).tolist())], names)[1]
+
+    def edges(self, name):
+        # Histogram bin edges of a column, over its whole range like summary.binned()
+        if name not in self._edges:
+            low, high = self.range(name)
+            self._edges[name] = summary.edges(0.0, 1.0) if low is None else summary.edges(float(low), float(high))
+        return self._edges[name]
+
+    def close(self):
+        self.pool.close()
+
+
+def get(path=None):
+    # Store of the current input.sqlite for this process, reopened when the ETL replaced the file
+    global _current
+    path = path_for(path or settings.input_path)
+    current = datastore.signature(path)
+    with _lock:
+        if _current is None or _current.signature != current:
+            # Sessions still using the previous store keep their connections to the old file
+            _current = Store(path, settings.sqlite_connections)
+        return _current
+
+
+def current():
+    # The current store without opening one, None before the first get()
+    with _lock:
+        return _current
+
+
+def reset():
+    global _current
+    with _lock:
+        _current = None
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print("Wrote %s" % convert(path))
@@ -0,0 +1,109 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Statistics of the selection shown next to the plot, and the counts of the
+# marginal histograms. Every axis column is binned once per dataset (bin code
+# per row, see binned()), so the histograms of a selection are a bincount of
+# the codes of its rows, and rows missing a value are found from the same codes.
+
+# Histogram bins per axis
+bins = 40
+
+# Rows drawn (both values present) and rows missing x or y, per axis statistics,
+# drawn rows per database and the histogram counts of the drawn rows
+Summary = namedtuple('Summary', ['shown', 'missing', 'x', 'y', 'databases', 'x_counts', 'y_counts'])
+Axis = namedtuple('Axis', ['minimum', 'maximum', 'median'])
+
+
+def edges(low, high):
+    # Bin edges over [low, high]
+    if low == high:
+        high = low + 1
+    return np.linspace(low, high, bins + 1)
+
+
+def bin_codes(values, edges):
+    # Bin of every value: codes 0..bins-1, `bins` for NaN
+    low, high = edges[0], edges[-1]
+    missing = np.isnan(values)
+    scaled = (np.clip(np.where(missing, low, values), low, high) - low) / (high - low) * bins
+    codes = np.minimum(scaled.astype(np.uint8), bins - 1)
+    codes[missing] = bins
+    return codes
+
+
+def binned(dataset, name):
+    # (bin code per row, bin edges) of a numeric column
+    def compute(dataset):
+        values = np.asarray(dataset.column(name), dtype=float)
+        finite = values[np.isfinite(values)]
+        column_edges = edges(float(finite.min()), float(finite.max())) if len(finite) else edges(0.0, 1.0)
+        return bin_codes(values, column_edges), column_edges
+    return dataset.derived('bins:%s' % name, compute)
+
+
+def axis(values):
+    if len(values) == 0:
+        return Axis(np.nan, np.nan, np.nan)
+    return Axis(float(values.min()), float(values.max()), float(np.median(values)))
+
+
+def summarize(dataset, rows, x_name, y_name):
+    x_codes = binned(dataset, x_name)[0][rows]
+    y_codes = binned(dataset, y_name)[0][rows]
+    both = (x_codes < bins) & (y_codes < bins)
+    drawn = rows[both]
+    codes, databases = dataset.category('DB')
+    counts = np.bincount(codes[drawn] + 1, minlength=len(databases) + 1)[1:]
+    return Summary(
+        shown=len(drawn),
+        missing=len(rows) - len(drawn),
+        x=axis(dataset.column(x_name)[drawn]),
+        y=axis(dataset.column(y_name)[drawn]),
+        databases=dict((name, int(count)) for name, count in zip(databases, counts)),
+        x_counts=np.bincount(x_codes[both], minlength=bins),
+        y_counts=np.bincount(y_codes[both], minlength=bins),
+    )
+
+
+def summarize_values(x, y, databases, names, x_edges, y_edges):
+    # Summary of rows from their values instead of the dataset's bin codes (the
+    # columns a sqlstore.Store query returned): x, y and DB of each row, the
+    # database names to count and the axes' bin edges
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    x_codes = bin_codes(x, x_edges)
+    y_codes = bin_codes(y, y_edges)
+    both = (x_codes < bins) & (y_codes < bins)
+    shown = int(np.count_nonzero(both))
+    drawn = databases[both]
+    return Summary(
+        shown=shown,
+        missing=len(x) - shown,
+        x=axis(x[both]),
+        y=axis(y[both]),
+        databases=dict((name, int(np.count_nonzero(drawn == name))) for name in names),
+        x_counts=np.bincount(x_codes[both], minlength=bins),
+        y_counts=np.bincount(y_codes[both], minlength=bins),
+    )
+
+
+def histogram_data(edges, counts):
+    # Columns of a marginal histogram's quads
+    return dict(start=edges[:-1], end=edges[1:], count=counts)
+
+
+def number(value):
+    if np.isnan(value):
+        return '-'
+    return '{:,.0f}'.format(value) if abs(value) >= 1000 else '{:.4g}'.format(value)
+
+
+def html(summary, x_label, y_label):
+    rows = ['<tr><th></th><th>Min</th><th>Median</th><th>Max</th></tr>']
+    for label, values in ((x_label, summary.x), (y_label, summary.y)):
+        rows.append('<tr><td>%s</td><td>%s</td><td>%s</td><td>%s</td></tr>' % (
+            label, number(values.minimum), number(values.median), number(values.maximum)))
+    databases = ', '.join('%s: %d' % (name, count) for name, count in sorted(summary.databases.items()))
+    return '<table>%s</table><p>%s. Missing %s or %s: %d</p>' % (''.join(rows), databases, x_label, y_label, summary.missing)
@@ -1,6 +1,18 @@
+import argparse
+import json
+import shutil
+import time
+import numpy as np
 import pandas, os
 from collections import Counter
 
+import classify
+import columnar
+import manifest
+import download
+import settings
+import sqlstore
+
 # Download urls for MarRef and MarDB metadata (.tsv)
 urls = {'MarRef': 'https://s1.sfb.uit.no/public/mar/MarRef/Metadatabase/Current.tsv', 
         'MarDB': 'https://s1.sfb.uit.no/public/mar/MarDB/Metadatabase/Current.tsv'}
@@ -38,14 +50,14 @@ floatheadermap = {
 
         }
 
-complete_df = pandas.DataFrame()
 
-# Iterate over DB's and urls to s1.sfb.uit.no
-for db, url in urls.items():
+# Columns taken from the metadata files. A row changed when any of them changed
+raw_columns = list(strheadermap) + list(floatheadermap)
+
+
+def parse_metadata(db, metadata):
     # Set tmp df, to store curent data iteration in
     tmp = pandas.DataFrame()
-    # Download and parse mmp metadta into pandas df
-    metadata = pandas.read_csv(url, sep='\t')
     # Create tmpdf columns with str, ensuring correct headernames
     for new, old in strheadermap.items():
         tmp[new] = metadata[old].astype(str)
@@ -59,88 +71,220 @@ for db, url in urls.items():
     tmp['db'] = tmp['DB'].str.lower()
 
     # Fix rRNA triplet bars (Metadata has one rrnas column, visualization template should have 3, rRNA5S, rRNA16S and rRNA23S)
-    rrnas = tmp['rrnas'].str.split(pat=',', n=-1,  expand=True)
+    rrnas = tmp['rrnas'].str.split(pat=',', n=-1,  expand=True).reindex(columns=range(3))
     tmp['rRNA5S'] = pandas.to_numeric(rrnas[0], errors='coerce')
     tmp['rRNA16S'] = pandas.to_numeric(rrnas[1], errors='coerce')
     tmp['rRNA23S'] = pandas.to_numeric(rrnas[2], errors='coerce')
+    return tmp
 
-    # Concatonate this df with that df
-    complete_df = pandas.concat([complete_df, tmp], ignore_index=True)
-
-# Calculate Draft quality based on data from dataframe
-quality = []
-for index, row in complete_df.iterrows():
-    if row['DB'] == 'MarRef':
-        quality.append('Finished')
-    elif row['Completeness'] == 'missing' or row['Contamination'] == 'missing':
-        quality.append('NA')
-    elif float(row['Completeness']) > 90 and float(row['Contamination']) < 5 and float(row['rRNA5S']) > 1 and float(row['rRNA16S']) > 1 and float(row['rRNA23S']) > 1 and float(row['Unique_tRNAs']) > 17:
-        quality.append('High Quality Draft')
-    elif float(row['Completeness']) > 90 and float(row['Contamination']) < 5:
-        quality.append('Near Complete')
-    elif float(row['Completeness']) >= 50 and float(row['Contamination']) < 10:
-        quality.append('Medium Quality Draft')
-    elif float(row['Completeness']) < 50 and float(row['Contamination']) < 10:
-        quality.append('Low Quality Draft')
-    elif float(row['Contamination']) > 10:
-        quality.append('Very Low Quality Draft')
-    else:
-        quality.append('NA')
-complete_df['quality'] = quality
-
-# Set indivival colors for discrete databases
-colorarray = []
-for DB, apt in zip(complete_df['DB'], complete_df['analysis_project_type']):
-        if DB == "MarRef" and apt == "missing":
-                colorarray.append("grey")
-        elif DB == "MarDB" and apt == "missing":
-                colorarray.append("grey")
-        elif DB == "MarRef":
-                colorarray.append("blue")
-        elif DB == "MarDB":
-                colorarray.append("green")
-        else:
-                colorarray.append("grey")
-complete_df['color'] = colorarray
-
-# Tune alphas for analysis_project_type
-alpha = []
-for analysis_type in complete_df['analysis_project_type']:
-        if analysis_type == "Whole genome sequencing (WGS)":
-                alpha.append(1)
-        elif analysis_type == "Metagenome assembled genome (MAG)":
-                alpha.append(0.6)
-        elif analysis_type == "Single amplified genome (SAG)":
-                alpha.append(0.4)
-        else:
-                alpha.append(1)
-complete_df['alpha'] = alpha
-
-# Make labels for legend
-label= []
-for DB, apt in zip(complete_df['DB'], complete_df['analysis_project_type']):
-        if DB == "MarRef" and apt == "missing":
-                label.append("MarRef (Unknown type)")
-        elif DB == "MarDB" and apt == "missing":
-                label.append("MarDB (Unknown type)")
-        elif DB == "MarRef" and apt == "Whole genome sequencing (WGS)":
-                label.append("MarRef (Whole genome sequencing (WGS))")
-        elif DB == "MarDB" and apt == "Whole genome sequencing (WGS)":
-                label.append("MarDB (Whole genome sequencing (WGS))")
-        elif DB == "MarRef" and apt == "Metagenome assembled genome (MAG)":
-                label.append("MarRef (Metagenome assembled genome (MAG))")
-        elif DB == "MarDB" and apt == "Metagenome assembled genome (MAG)":
-                label.append("MarDB (Metagenome assembled genome (MAG))")
-        elif DB == "MarRef" and apt == "Single amplified genome (SAG)":
-                label.append("MarRef (Single amplified genome (SAG))")
-        elif DB == "MarDB" and apt == "Single amplified genome (SAG)":
-                label.append("MarDB (Single amplified genome (SAG))")
+
+def parse(db, path):
+    # Parse mmp metadta into pandas df
+    return parse_metadata(db, pandas.read_csv(path, sep='\t'))
+
+
+def build(paths):
+    complete_df = pandas.DataFrame()
+    # Iterate over DB's and downloaded metadata files
+    for db, path in paths.items():
+        # Concatonate this df with that df
+        complete_df = pandas.concat([complete_df, parse(db, path)], ignore_index=True)
+
+    # Calculate Draft quality, colors, alphas and legend labels. The rules are declared as tables in
+    # classify.py and applied as whole-column masks
+    classify.classify(complete_df)
+    return complete_df
+
+
+def row_keys(frame):
+    return (frame['DB'] + '/' + frame['mmp_ID'].astype(str)).values
+
+
+def row_hashes(frame):
+    # Hash of the metadata fields of every row. Numbers are hashed as floats, so a
+    # chunk parsed as integers hashes like the same values parsed as floats
+    raw = frame[raw_columns].copy()
+    for name in floatheadermap:
+        raw[name] = raw[name].astype(float)
+    return pandas.util.hash_pandas_object(raw, index=False).values
+
+
+def append_tsv(frame, path, start):
+    # Append rows to a TSV with a running index, writing the header for the first rows only
+    frame.index = range(start, start + len(frame))
+    frame.to_csv(path, sep="\t", mode='a' if start else 'w', header=not start)
+    return start + len(frame)
+
+
+def read_text_chunks(path, chunk_size):
+    # Rows of a TSV written by this script as untouched strings, so copying them is lossless
+    return pandas.read_csv(path, sep='\t', index_col=0, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+def publish(path, output, chunk_size, sqlite):
+    # Replace `output` (input.tsv) with the TSV at `path`. The files the explorer
+    # loads instead are written first: the typed, memory-mappable copy
+    # (columnar.py), its statistics and slider ranges (manifest.py)
+    # and with `sqlite` the indexed database for MMP_BACKEND=sqlite (sqlstore.py).
+    # input.tsv is replaced last and keeps the mtime of `path`, older than
+    # input.col, so a running server loads input.col once and never parses the TSV.
+    # The TSV is read in chunks of chunk_size rows, not as a whole
+    columnar.convert(path, columnar.path_for(output), chunk_size)
+    manifest.write(output)
+    if sqlite:
+        sqlstore.convert(path, sqlstore.path_for(output))
+    # Replaced in one step, a running server never sees a half written file
+    os.replace(path, output)
+
+
+def update_incremental(paths, output, chunk_size, keep, sqlite=False):
+    # Apply the metadata files to the previous snapshot instead of rebuilding everything.
+    #
+    # Rows are keyed on DB and mmp_ID. The metadata is streamed in chunks and only
+    # added or changed rows (by hash of their metadata fields) get their derived
+    # columns recomputed. The new snapshot is the previous one without changed and
+    # deleted rows, followed by the recomputed rows. Writes, in <output dir>/snapshots:
+    #   input-<version>.tsv     the snapshot, also copied to `output`
+    #   keys-<version>.tsv      key and hash of every row, to diff the next run against
+    #   changes-<version>.json  manifest of added, changed and deleted keys
+    #   current.json            the latest version
+    # and publishes the snapshot as `output` (see publish()).
+    # Returns the manifest, or None if nothing changed.
+    snapshot_dir = os.path.join(os.path.dirname(output), 'snapshots')
+    if not os.path.isdir(snapshot_dir):
+        os.makedirs(snapshot_dir)
+    current_path = os.path.join(snapshot_dir, 'current.json')
+    current = None
+    previous = pandas.Series([], dtype=np.uint64)
+    if os.path.exists(current_path):
+        with open(current_path) as handle:
+            current = json.load(handle)
+        keys = pandas.read_csv(os.path.join(snapshot_dir, current['keys']), sep='\t', dtype={'key': str, 'hash': np.uint64})
+        previous = pandas.Series(keys['hash'].values, index=keys['key'].values)
+
+    version = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+    if current and version <= current['version']:
+        version = current['version'] + '.1'
+    updates_path = os.path.join(snapshot_dir, 'updates-%s.tsv' % version)
+
+    seen = np.zeros(len(previous), dtype=bool)
+    added, changed, modified_hashes = [], [], []
+    written = 0
+    for db, path in paths.items():
+        for metadata in pandas.read_csv(path, sep='\t', chunksize=chunk_size):
+            tmp = parse_metadata(db, metadata)
+            keys = row_keys(tmp)
+            hashes = row_hashes(tmp)
+            position = previous.index.get_indexer(keys)
+            is_new = position < 0
+            is_changed = ~is_new
+            if len(previous):
+                is_changed &= previous.values[np.maximum(position, 0)] != hashes
+            seen[position[~is_new]] = True
+            modified = is_new | is_changed
+            if modified.any():
+                # Calculate Draft quality, colors, alphas and legend labels for the rows that need it
+                written = append_tsv(classify.classify(tmp[modified].copy()), updates_path, written)
+                added.extend(keys[is_new])
+                changed.extend(keys[is_changed])
+                modified_hashes.append(pandas.Series(hashes[modified], index=keys[modified]))
+    deleted = list(previous.index[~seen])
+
+    if current and not (added or changed or deleted):
+        if os.path.exists(updates_path):
+            os.remove(updates_path)
+        return None
+
+    # New snapshot: unchanged rows of the previous one, then the recomputed rows
+    snapshot = 'input-%s.tsv' % version
+    snapshot_path = os.path.join(snapshot_dir, snapshot)
+    dropped = set(changed) | set(deleted)
+    start = 0
+    if current:
+        for rows in read_text_chunks(os.path.join(snapshot_dir, current['snapshot']), chunk_size):
+            start = append_tsv(rows[~pandas.Series(row_keys(rows)).isin(dropped).values], snapshot_path, start)
+    if written:
+        for rows in read_text_chunks(updates_path, chunk_size):
+            start = append_tsv(rows, snapshot_path, start)
+        os.remove(updates_path)
+
+    hashes = pandas.concat([previous[~previous.index.isin(dropped)]] + modified_hashes)
+    keys = 'keys-%s.tsv' % version
+    pandas.DataFrame({'key': hashes.index, 'hash': hashes.values}).to_csv(os.path.join(snapshot_dir, keys), sep='\t', index=False)
+
+    manifest = {
+        'version': version,
+        'previous': current['version'] if current else None,
+        'rows': len(hashes),
+        'counts': {'added': len(added), 'changed': len(changed), 'deleted': len(deleted)},
+        'added': list(added),
+        'changed': list(changed),
+        'deleted': deleted,
+    }
+    with open(os.path.join(snapshot_dir, 'changes-%s.json' % version), 'w') as handle:
+        json.dump(manifest, handle)
+
+    # Publish, then current.json points at the new version
+    shutil.copyfile(snapshot_path, output + '.part')
+    publish(output + '.part', output, chunk_size, sqlite)
+    with open(current_path + '.part', 'w') as handle:
+        json.dump({'version': version, 'snapshot': snapshot, 'keys': keys}, handle)
+    os.replace(current_path + '.part', current_path)
+
+    # Keep the last `keep` snapshots (manifests are kept)
+    versions = sorted(name[len('keys-'):-len('.tsv')] for name in os.listdir(snapshot_dir) if name.startswith('keys-'))
+    for old in versions[:-keep]:
+        for name in ['input-%s.tsv' % old, 'keys-%s.tsv' % old]:
+            if os.path.exists(os.path.join(snapshot_dir, name)):
+                os.remove(os.path.join(snapshot_dir, name))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download MarRef/MarDB metadata and rebuild the explorer's input.tsv")
+    parser.add_argument('--url', action='append', default=[], metavar='DB=URL', help="override or add a metadata url")
+    parser.add_argument('--output', default=settings.input_path)
+    parser.add_argument('--cache-dir', help="raw metadata cache (default: <output dir>/cache)")
+    parser.add_argument('--force', action='store_true', help="rebuild even if no metadata file changed")
+    parser.add_argument('--incremental', action='store_true', help="only recompute added and changed rows, keep versioned snapshots")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="rows per chunk in incremental mode and when converting input.tsv")
+    parser.add_argument('--keep', type=int, default=5, help="snapshots to keep in incremental mode")
+    parser.add_argument('--sqlite', action='store_true', default=settings.backend == 'sqlite', help="also write input.sqlite for MMP_BACKEND=sqlite (default when set)")
+    args = parser.parse_args()
+
+    sources = dict(urls)
+    for option in args.url:
+        db, url = option.split('=', 1)
+        sources[db] = url
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    cache_dir = args.cache_dir or os.path.join(output_dir, 'cache')
+
+    # Download all metadata files concurrently, unchanged files (HTTP 304) are taken from the cache
+    fetched = download.fetch_all(sources, cache_dir)
+    if not args.force and os.path.exists(args.output):
+        built = os.path.getmtime(args.output)
+        if not any(changed or os.path.getmtime(path) > built for path, changed in fetched.values()):
+            print("Metadata unchanged, keeping %s" % args.output)
+            return
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    paths = dict((db, path) for db, (path, changed) in fetched.items())
+    if args.incremental:
+        changes = update_incremental(paths, os.path.abspath(args.output), args.chunk_size, args.keep, args.sqlite)
+        if changes is None:
+            print("No rows changed, keeping %s" % args.output)
         else:
-                label.append("Unknown")
-complete_df['label'] = label
+            print("Snapshot %s: %d rows (%d added, %d changed, %d deleted)" % (
+                changes['version'], changes['rows'], changes['counts']['added'], changes['counts']['changed'], changes['counts']['deleted']))
+        return
 
-if not os.path.isdir("mmp_interactive/inputdata"):
-    os.mkdir("mmp_interactive/inputdata")
+    complete_df = build(paths)
+    complete_df.to_csv(args.output + '.part', sep="\t")
+    del complete_df
+    publish(args.output + '.part', args.output, args.chunk_size, args.sqlite)
 
-complete_df.to_csv(os.path.join(os.getcwd(), "mmp_interactive/inputdata/input.tsv"), sep="\t")
 
+if __name__ == '__main__':
+    main()